@@ -7,16 +7,27 @@ import platform
 import youtube_utils
 from PIL import Image, ImageTk
 import sys
-import io
 import time
+import multiprocessing
 
 # Ensure parent directory is on sys.path so relative imports work
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from audioVisualizerApp.consoleMain import consoleMain as run_consoleMain # type: ignore
+from audioVisualizerApp.pipeline import JobConfig, run_job # type: ignore
+from audioVisualizerApp.consoleMain import get_env_int, get_worker_count, get_local_media # type: ignore
+import analysis_cache
+import thumbnails
 from config import sanitize_filename
 import visualization
 
+def track_image_paths(folder):
+    """Per-track visualization PNGs in an output folder, in track order"""
+    return sorted([
+        os.path.join(folder, f)
+        for f in os.listdir(folder)
+        if f.endswith(".png") and "_combined" not in f
+    ])
+
 class ColorPreviewWindow(tk.Toplevel):
     def __init__(self, master, combined_path, album_title):
         super().__init__(master)
@@ -25,6 +36,10 @@ class ColorPreviewWindow(tk.Toplevel):
         self.combined_path = combined_path
         self.album_title = album_title
         self.output_folder = os.path.dirname(combined_path)
+        # Track images and title font are loaded once; slider moves only repaint the background
+        self.compositor = visualization.AlbumCompositor(
+            track_image_paths(self.output_folder), album_title, margin=5, border=30
+        )
 
         self.r = tk.IntVar(value=128)
         self.g = tk.IntVar(value=0)
@@ -46,28 +61,18 @@ class ColorPreviewWindow(tk.Toplevel):
     def update_preview(self):
         rgb = (self.r.get(), self.g.get(), self.b.get())
         try:
-            image_files = sorted([
-                os.path.join(self.output_folder, f)
-                for f in os.listdir(self.output_folder)
-                if f.endswith(".png") and "_combined" not in f
-            ])
-            preview_path = visualization.create_combined_image(
-                image_files=image_files,
-                output_folder=self.output_folder,
-                album_title=self.album_title,
-                bg_color=rgb
-            )
-            preview_img = Image.open(preview_path)
+            preview_img = self.compositor.recompose(rgb)
             preview_img.thumbnail((400, 300))
             img_tk = ImageTk.PhotoImage(preview_img)
             self.preview_label.configure(image=img_tk)
             self.preview_label.image = img_tk
-            self.preview_file = preview_path
+            self.preview_color = rgb
         except Exception as e:
             print(f"[ERROR] Preview update failed: {e}")
 
     def apply_color(self):
-        self.master.output_image_path = self.preview_file
+        self.compositor.recompose(self.preview_color).save(self.combined_path)
+        self.master.output_image_path = self.combined_path
         self.master.load_preview()
         self.destroy()
 
@@ -82,6 +87,8 @@ class VisualizerGUI:
         self.selected_index = None
         self.custom_color = None
         self.output_image_path = None
+        self.compositor = None
+        self.compositor_folder = None
 
         self.build_ui()
 
@@ -106,7 +113,7 @@ class VisualizerGUI:
 
         instruction = tk.Label(
             left_frame,
-            text="Paste a YouTube playlist link, full album video, or search a title",
+            text="Paste a YouTube playlist link, full album video, local folder, or search a title",
             font=("Helvetica", 11),
             fg="lightgray",
             bg="#1e1e1e"
@@ -216,24 +223,18 @@ class VisualizerGUI:
         self.log(f"🎨 Updating background color to RGB{rgb}")
 
         try:
-            from config import sanitize_filename
-            import visualization
-
             folder = os.path.dirname(self.output_image_path)
             album_title = os.path.basename(self.output_image_path).replace("_combined.png", "")
 
-            image_paths = sorted([
-                os.path.join(folder, f)
-                for f in os.listdir(folder)
-                if f.endswith(".png") and "_combined" not in f
-            ])
-
-            new_combined_path = visualization.create_combined_image(
-                image_paths=image_paths,
-                output_folder=folder,
-                album_title=album_title,
-                bg_color=rgb
-            )
+            # Reuse the loaded track images and fitted title across color changes
+            if self.compositor_folder != folder:
+                self.compositor = visualization.AlbumCompositor(
+                    track_image_paths(folder), album_title, margin=5, border=30
+                )
+                self.compositor_folder = folder
+
+            new_combined_path = visualization.combined_image_path(folder, album_title)
+            self.compositor.recompose(rgb).save(new_combined_path)
 
             self.output_image_path = new_combined_path
             self.load_preview()
@@ -241,21 +242,26 @@ class VisualizerGUI:
         except Exception as e:
             self.log(f"❌ Failed to update background: {e}")
 
-        def log(self, message):
-            self.status_text.insert(tk.END, message + "\n")
-            self.status_text.see(tk.END)
-
     def search_youtube(self):
         query = self.query_var.get().strip()
         if not query:
             messagebox.showwarning("Input required", "Please enter a YouTube link or search query.")
             return
 
+        if os.path.exists(query):
+            self.query_results = [{'title': os.path.basename(os.path.normpath(query))}]
+            self.result_listbox.delete(0, tk.END)
+            self.result_listbox.insert(tk.END, f"📁 {self.query_results[0]['title']}")
+            self.result_listbox.select_set(0)
+            self.result_listbox.activate(0)
+            self.log(f"✅ Local audio: {query}")
+            return
+
         self.log(f"🔎 Searching for: {query}")
 
         if "youtube.com" in query or "youtu.be" in query or "list=" in query:
             try:
-                info = youtube_utils.load_youtube_url(query)
+                info = youtube_utils.load_youtube_url(query, get_local_media())
                 if not info:
                     self.log("❌ Could not load video or playlist. It may not contain multiple tracks or chapters.")
                     return
@@ -270,12 +276,15 @@ class VisualizerGUI:
             return
 
         try:
-            results = youtube_utils.search_youtube_playlist(query + " playlist", return_entries_only=True)
+            media_dir = get_local_media()
+            results = youtube_utils.search_youtube_playlist(query + " playlist", return_entries_only=True,
+                                                            media_dir=media_dir)
             if not results:
-                results = youtube_utils.search_youtube_playlist(query + " full album", return_entries_only=True)
+                results = youtube_utils.search_youtube_playlist(query + " full album", return_entries_only=True,
+                                                                media_dir=media_dir)
 
             if not results:
-                results = youtube_utils.search_youtube_playlist(query, return_entries_only=True)
+                results = youtube_utils.search_youtube_playlist(query, return_entries_only=True, media_dir=media_dir)
 
             if not results:
                 self.log("❌ No search results found.")
@@ -300,44 +309,38 @@ class VisualizerGUI:
         self.selected_index = selected[0]
 
         query = self.query_var.get().strip()
-        if "youtube.com" in query or "youtu.be" in query or "list=" in query:
-            os.environ["AUDIOVISUALIZER_DIRECT_URL"] = query
+        bg_color = None if self.use_auto_color.get() else self.custom_color
+        if os.path.exists(query):
+            config = JobConfig(folder=query, bg_color=bg_color)
+        elif "youtube.com" in query or "youtu.be" in query or "list=" in query:
+            config = JobConfig(url=query, bg_color=bg_color)
         else:
-            os.environ["AUDIOVISUALIZER_INPUT"] = query
-            os.environ["AUDIOVISUALIZER_SELECTION_INDEX"] = str(self.selected_index)
-
-        os.environ["AUDIOVISUALIZER_COLOR"] = (
-            "auto" if self.use_auto_color.get() else ",".join(map(str, self.custom_color))
-        )
+            config = JobConfig(query=query, selection_index=self.selected_index, bg_color=bg_color)
 
         self.progress['value'] = 0
         self.save_button.config(state="disabled")
         self.color_button.config(state="disabled")  # disable color change while generating
         self.status_text.delete(1.0, tk.END)
         self.log("⏳ Starting visualization...")
-        Thread(target=self.run_pipeline).start()
+        self.compositor_folder = None  # track images will be regenerated
+        Thread(target=self.run_pipeline, args=(config,)).start()
 
-    def run_pipeline(self):
+    def on_progress(self, done, total, title):
+        self.progress['value'] = int(done / total * 100)
+        self.log(f"🎵 Finished track {done}/{total}: {title}")
+
+    def run_pipeline(self, config):
         try:
-            import contextlib
-
-            class StreamInterceptor(io.StringIO):
-                def write(this, txt):
-                    if txt.strip():
-                        self.log(txt.strip())
-                        if txt.startswith("[PROGRESS]"):
-                            try:
-                                percent = int(txt.split()[1].replace("%", ""))
-                                self.progress['value'] = percent
-                            except:
-                                pass
-                        elif txt.startswith("[OUTPUT]"):
-                            self.output_image_path = txt.replace("[OUTPUT]", "").strip()
-                    super().write(txt)
-
-            stream = StreamInterceptor()
-            with contextlib.redirect_stdout(stream), contextlib.redirect_stderr(stream):
-                run_consoleMain()
+            result = run_job(
+                config, self.on_progress,
+                workers=get_worker_count(),
+                download_workers=get_env_int("AUDIOVISUALIZER_DOWNLOAD_WORKERS", 2),
+                queue_depth=get_env_int("AUDIOVISUALIZER_QUEUE_DEPTH", 2),
+                cache=analysis_cache.get_default_cache(),
+                thumbnails=thumbnails.get_default_fetcher(),
+                media_dir=get_local_media()
+            )
+            self.output_image_path = result.combined_path
 
             self.log("✅ Done generating image.")
             self.color_button.config(state="normal")  # allow recoloring now
@@ -382,6 +385,8 @@ class VisualizerGUI:
                     self.log(f"❌ Failed to save image: {e}")
 
 if __name__ == "__main__":
+    # Needed for the track process pool in the frozen (PyInstaller) build
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = VisualizerGUI(root)
     root.mainloop()
@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "audiovisualizer", "analysis")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def file_digest(file_path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, for caching local audio by content rather than name"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class AnalysisCache:
+    """
+    On-disk cache of per-track analysis arrays (spectral summaries), stored as .npy files
+    named by a hash of the audio source (video id or content digest) and the analysis
+    parameters.
+    Least recently used entries are evicted once the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, source_id, **params):
+        """Cache key for an audio source analysed with the given parameters"""
+        payload = json.dumps({'source': source_id, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key):
+        """Cached analysis array for `key`, or None on a miss"""
+        path = self._path(key)
+        try:
+            array = np.load(path)
+            os.utime(path)  # mark as recently used
+            return array
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, array):
+        """Store an analysis array, then evict old entries if the cache is over its size cap"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(array))
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"[WARN] Could not write analysis cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in `max_bytes`"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npy'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+                except OSError:
+                    continue  # removed by another worker
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
+
+def get_default_cache():
+    """
+    Cache configured from AUDIOVISUALIZER_CACHE_DIR and AUDIOVISUALIZER_CACHE_MAX_MB,
+    or None when AUDIOVISUALIZER_CACHE=0 disables caching.
+    """
+    if os.environ.get("AUDIOVISUALIZER_CACHE", "1") == "0":
+        return None
+    cache_dir = os.environ.get("AUDIOVISUALIZER_CACHE_DIR", DEFAULT_CACHE_DIR)
+    max_mb = os.environ.get("AUDIOVISUALIZER_CACHE_MAX_MB", "")
+    max_bytes = int(max_mb) * 1024 * 1024 if max_mb.isdigit() else DEFAULT_MAX_BYTES
+    try:
+        return AnalysisCache(cache_dir, max_bytes)
+    except OSError as e:
+        print(f"[WARN] Analysis cache disabled: {e}")
+        return None
@@ -1,109 +1,569 @@
+import os
+import math
+import time
+import subprocess
 import numpy as np
-from scipy.io import wavfile
-from scipy import signal
+from fractions import Fraction
+from functools import lru_cache
+import metrics
 
-def process_audio(file_path, num_segments=1000):
+@lru_cache(maxsize=16)
+def _hann_window(length):
+    """Cached Hann window, shared by every frame of the same length"""
+    # SciPy is imported on first use: scipy.signal and scipy.io dominate startup time
+    from scipy import signal
+    window = signal.windows.hann(length)
+    window.flags.writeable = False
+    return window
+
+@lru_cache(maxsize=16)
+def _frequency_axis(length, sample_rate):
+    """Cached rfft frequency bins for a frame length and sample rate"""
+    freq_bins = np.fft.rfftfreq(length, 1 / sample_rate)
+    freq_bins.flags.writeable = False
+    return freq_bins
+
+def frame_peak_bins(frames):
+    """Index of the strongest rfft bin in each row of a 2-D frame matrix, using one batched rfft (rows of at least 2 samples)"""
+    frame_length = frames.shape[1]
+    spectrum = np.abs(np.fft.rfft(frames * _hann_window(frame_length), axis=1))
+    return np.argmax(spectrum, axis=1)
+
+# Spectral summary resolution: ~93 ms frames every ~46 ms at 44.1 kHz, finer than any
+# output width a track is rendered at
+SUMMARY_FRAME_LENGTH = 4096
+SUMMARY_HOP = 2048
+
+def _downmix(block):
+    """Mono float32 of a (samples[, channels]) block"""
+    if block.ndim == 1:
+        return block.astype(np.float32, copy=False)
+    # Summing channel columns is several times faster than mean(axis=1) over interleaved samples
+    mono = block[:, 0].astype(np.float32)
+    for channel in range(1, block.shape[1]):
+        mono += block[:, channel]
+    if block.shape[1] > 1:
+        mono *= 1 / block.shape[1]
+    return mono
+
+def iter_overlapping_frames(audio_data, frame_length=SUMMARY_FRAME_LENGTH, hop=SUMMARY_HOP, max_block_samples=None):
     """
-    Process entire audio by dividing it into exactly `num_segments` equal parts
-    and convert dominant frequencies to RGB colors.
+    Yield mono float32 (frames, frame_length) blocks of frames starting every `hop` samples,
+    at least one frame per block and about `max_block_samples` samples each. Only the block
+    being transformed is converted from the (possibly memory-mapped) source; audio shorter
+    than one frame is zero-padded to a single frame.
     """
-    try:
-        print(f"Reading audio file: {file_path}")
-        sample_rate, audio_data = wavfile.read(file_path)
+    total = len(audio_data)
+    if total == 0:
+        return
+    if total < frame_length:
+        padded = np.zeros((frame_length,) + audio_data.shape[1:], dtype=np.float32)
+        padded[:total] = audio_data
+        audio_data, total = padded, frame_length
+    num_frames = 1 + (total - frame_length) // hop
+    step = max(1, (max_block_samples or total) // hop)
+    for first in range(0, num_frames, step):
+        last = min(first + step, num_frames)
+        block = _downmix(audio_data[first * hop:(last - 1) * hop + frame_length])
+        yield np.lib.stride_tricks.sliding_window_view(block, frame_length)[::hop]
 
-        # Convert to mono if stereo
-        if len(audio_data.shape) > 1:
-            audio_data = np.mean(audio_data, axis=1)
+# Columns of a spectral summary, one row per frame. The band edges and top-k count are
+# part of the analysis, so changing them means re-analysing (see pipeline.ANALYSIS_PARAMS)
+SUMMARY_FIELDS = ('peak_hz', 'peak_magnitude', 'centroid_hz', 'top_k_hz', 'low', 'mid', 'high')
+_PEAK_HZ = SUMMARY_FIELDS.index('peak_hz')
+_PEAK_MAGNITUDE = SUMMARY_FIELDS.index('peak_magnitude')
+_BAND_POWER = slice(SUMMARY_FIELDS.index('low'), SUMMARY_FIELDS.index('high') + 1)
+BAND_EDGES_HZ = (250, 4000)
+TOP_K = 5
+COLOR_MODES = ('peak', 'centroid', 'top_k', 'bands', 'loudness')
+# Frames with an RMS level below this (dB relative to full scale) are silent: they are not
+# transformed and keep all-zero features
+SILENCE_THRESHOLD_DB = -60
+# How silent columns are drawn: hold the previous color, fade it to black over
+# SILENCE_FADE_FRACTION of the width, or trim leading/trailing silence (holding inside)
+SILENCE_POLICIES = ('hold', 'fade', 'trim')
+SILENCE_FADE_FRACTION = 0.02
+# Columns this far below the loudest one are drawn black in 'loudness' mode
+LOUDNESS_RANGE_DB = 40
 
-        # Normalize
-        if audio_data.dtype != np.float32:
-            audio_data = audio_data.astype(np.float32)
-            max_val = np.iinfo(np.int16).max if audio_data.max() > 1.0 else 1.0
-            audio_data = audio_data / max_val
+@lru_cache(maxsize=16)
+def _band_matrix(length, sample_rate, band_edges=BAND_EDGES_HZ):
+    """(bins, bands) 0/1 matrix assigning each rfft bin to its low/mid/high band"""
+    bands = np.searchsorted(band_edges, _frequency_axis(length, sample_rate), side='right')
+    matrix = (bands[:, np.newaxis] == np.arange(len(band_edges) + 1)).astype(np.float32)
+    matrix.flags.writeable = False
+    return matrix
 
-        total_length = len(audio_data)
-        segment_samples = total_length // num_segments
-        print(f"Splitting into {num_segments} segments of ~{segment_samples} samples each")
+def frame_features(spectrum, freqs, band_matrix, top_k=TOP_K):
+    """
+    SUMMARY_FIELDS of each row of a (frames, bins) magnitude spectrum: the strongest bin,
+    the magnitude-weighted centroid, the magnitude-weighted geometric mean of the `top_k`
+    strongest spectral peaks and the power in each band. Peaks are local maxima (bins
+    above both neighbours), so one loud partial's window lobe counts once rather than
+    filling all `top_k` places. Silent frames get 0 Hz everywhere.
+    """
+    rows = np.arange(len(spectrum))
+    bins = np.argmax(spectrum, axis=1)
+    total = spectrum.sum(axis=1)
+    silent = total == 0
+    weight = np.where(silent, 1, total)
+    centroid = np.where(silent, 0, spectrum @ freqs / weight)
 
-        colors = []
-        for i in range(num_segments):
-            start = i * segment_samples
-            end = (i + 1) * segment_samples if i < num_segments - 1 else total_length
-            segment = audio_data[start:end]
+    peaks = np.zeros_like(spectrum)
+    inner = spectrum[:, 1:-1]
+    np.copyto(peaks[:, 1:-1], inner, where=(inner > spectrum[:, :-2]) & (inner > spectrum[:, 2:]))
+    # top_k is small, so k argmax passes beat an argpartition of every bin several times over
+    top = np.empty((len(spectrum), min(top_k, spectrum.shape[1])), dtype=np.intp)
+    top_magnitude = np.empty(top.shape, dtype=spectrum.dtype)
+    for k in range(top.shape[1]):
+        top[:, k] = np.argmax(peaks, axis=1)
+        top_magnitude[:, k] = peaks[rows, top[:, k]]
+        peaks[rows, top[:, k]] = 0
+    top_weight = top_magnitude.sum(axis=1)
+    has_peaks = top_weight > 0
+    log_top = (top_magnitude * np.log10(np.maximum(freqs[top], 1))).sum(axis=1) / np.where(has_peaks, top_weight, 1)
+    # A spectrum without local maxima (flat or monotonic) falls back to its strongest bin
+    top_k_hz = np.where(has_peaks, 10 ** log_top, freqs[bins])
+    top_k_hz[silent] = 0
 
-            if len(segment) < 2:
-                continue  # skip tiny leftover segments
+    band_power = (spectrum * spectrum) @ band_matrix
+    return np.column_stack([freqs[bins], spectrum[rows, bins], centroid, top_k_hz, band_power]).astype(np.float32)
 
-            segment = segment * signal.windows.hann(len(segment))
-            fft_data = np.abs(np.fft.rfft(segment))
-            freq_bins = np.fft.rfftfreq(len(segment), 1 / sample_rate)
-            max_idx = np.argmax(fft_data)
-            max_freq = freq_bins[max_idx]
+def full_scale(dtype):
+    """Amplitude of a full-scale sample: the integer range, or 1.0 for float audio"""
+    return float(np.iinfo(dtype).max + 1) if np.issubdtype(dtype, np.integer) else 1.0
 
-            rgb = map_frequency_to_rgb(max_freq)
-            colors.append(rgb)
+def frame_levels_db(frames, scale=1.0):
+    """RMS level of each row of a frame matrix in dB relative to `scale` (-inf for digital silence)"""
+    power = np.einsum('ij,ij->i', frames, frames, dtype=np.float64) / frames.shape[1]
+    with np.errstate(divide='ignore'):
+        return 10 * np.log10(power / (scale * scale))
 
-        print(f"Generated {len(colors)} colors")
+def iter_stream_frames(blocks, frame_length=SUMMARY_FRAME_LENGTH, hop=SUMMARY_HOP):
+    """
+    iter_overlapping_frames for audio arriving as a sequence of (samples[, channels])
+    blocks, e.g. from an ffmpeg pipe. Only the incoming block and the frame_length - hop
+    samples of overlap carried over from the previous one are held; the frames match
+    those of the concatenated audio.
+    """
+    carry = np.zeros(0, dtype=np.float32)
+    total = 0
+    for block in blocks:
+        total += len(block)
+        buffer = np.concatenate([carry, _downmix(block)])
+        if len(buffer) < frame_length:
+            carry = buffer
+            continue
+        num_frames = 1 + (len(buffer) - frame_length) // hop
+        yield np.lib.stride_tricks.sliding_window_view(buffer, frame_length)[::hop][:num_frames]
+        carry = buffer[num_frames * hop:]
+    if 0 < total < frame_length:
+        padded = np.zeros(frame_length, dtype=np.float32)
+        padded[:total] = carry
+        yield padded[np.newaxis]
+
+def spectral_summary(audio_data, sample_rate, frame_length=SUMMARY_FRAME_LENGTH, hop=SUMMARY_HOP,
+                     max_block_samples=1 << 20, silence_db=SILENCE_THRESHOLD_DB):
+    """
+    Fine-grained per-frame summary of a track: an (N, len(SUMMARY_FIELDS)) float32 array
+    of the features of each overlapping Hann-windowed frame, all taken from one batched
+    rfft. Computed once, it can be pooled to any output width and color mode with
+    `summary_colors`.
+
+    Frames quieter than `silence_db` dBFS are gated out before the transform and keep
+    all-zero features (a peak magnitude of 0 marks a frame silent); None gates nothing.
+    """
+    frame_blocks = iter_overlapping_frames(audio_data, frame_length, hop, max_block_samples)
+    return _summarize_frames(frame_blocks, sample_rate, frame_length, full_scale(audio_data.dtype), silence_db,
+                             samples=len(audio_data))
+
+def _summarize_frames(frame_blocks, sample_rate, frame_length, scale, silence_db, **fields):
+    freqs = _frequency_axis(frame_length, sample_rate)
+    band_matrix = _band_matrix(frame_length, sample_rate)
+    results = []
+    skipped = 0
+    seconds = 0.0
+    for frames in frame_blocks:
+        start = time.perf_counter()
+        features = np.zeros((len(frames), len(SUMMARY_FIELDS)), dtype=np.float32)
+        if silence_db is None:
+            loud = slice(None)
+        else:
+            loud = frame_levels_db(frames, scale) >= silence_db
+            skipped += len(frames) - int(loud.sum())
+        if silence_db is None or loud.any():
+            spectrum = np.abs(np.fft.rfft(frames[loud] * _hann_window(frame_length), axis=1))
+            features[loud] = frame_features(spectrum, freqs, band_matrix)
+        results.append(features)
+        seconds += time.perf_counter() - start
+    summary = np.concatenate(results) if results else np.zeros((0, len(SUMMARY_FIELDS)), dtype=np.float32)
+    metrics.record('fft', seconds, frames=len(summary), silent_frames=skipped, **fields)
+    return summary
+
+def silent_frames(summary):
+    """Boolean mask of the frames of a spectral summary that were gated as silent"""
+    return summary[:, _PEAK_MAGNITUDE] == 0
+
+def trim_silence(summary):
+    """A spectral summary without its leading and trailing silent frames"""
+    sounding = np.flatnonzero(~silent_frames(summary))
+    if len(sounding) == 0:
+        return summary[:0]
+    return summary[sounding[0]:sounding[-1] + 1]
+
+def _column_starts(frames, width):
+    """First frame of each of `width` columns when there are at least as many frames"""
+    columns = (np.arange(frames) * width) // frames
+    return np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+
+def _nearest_frames(frames, width):
+    return (np.arange(width) * frames) // width
+
+def pool_summary(summary, width):
+    """
+    Peak frequency (Hz) of each of `width` columns of a spectral summary. A column covering
+    several frames takes the frequency of its loudest frame; when there are fewer frames
+    than columns, each column repeats the nearest frame.
+    """
+    frames = len(summary)
+    if frames == 0 or width <= 0:
+        return np.zeros(max(width, 0), dtype=np.float32)
+    if width >= frames:
+        return summary[_nearest_frames(frames, width), _PEAK_HZ]
+    starts = _column_starts(frames, width)
+    columns = np.repeat(np.arange(width), np.diff(np.r_[starts, frames]))
+    # Sorted by column, then magnitude: the last frame of each column is its loudest
+    order = np.lexsort((summary[:, _PEAK_MAGNITUDE], columns))
+    loudest = order[np.r_[starts[1:] - 1, frames - 1]]
+    return summary[loudest, _PEAK_HZ]
+
+def _pool_sum(values, width):
+    """Sum of `values` rows over each column; the nearest row when frames are scarce"""
+    frames = len(values)
+    if width >= frames:
+        return values[_nearest_frames(frames, width)]
+    return np.add.reduceat(values, _column_starts(frames, width), axis=0)
+
+def _pool_log_frequency(frequencies, power, width):
+    """Power-weighted geometric mean frequency of each column"""
+    weight = power + np.finfo(np.float32).tiny
+    log_sum = _pool_sum(np.log10(np.maximum(frequencies, 1)) * weight, width)
+    return 10 ** (log_sum / _pool_sum(weight, width))
+
+def _silent_columns(summary, width):
+    """Columns made up only of silent frames"""
+    return _pool_sum((~silent_frames(summary)).astype(np.int64), width) == 0
+
+def apply_silence_policy(colors, silent, policy='hold'):
+    """
+    Redraw the `silent` columns of a (width, 3) color row: 'hold' (and 'trim', whose edges
+    are already cut) repeats the last sounding column, 'fade' fades it to black. Silence
+    before the first sounding column holds that column, or is black when fading.
+    """
+    if not silent.any():
         return colors
+    sounding = np.flatnonzero(~silent)
+    if len(sounding) == 0:
+        return np.zeros_like(colors)
+    positions = np.arange(len(colors))
+    last = np.maximum.accumulate(np.where(silent, 0, positions))
+    leading = positions < sounding[0]
+    last[leading] = sounding[0]
+    colors = colors[last]
+    if policy == 'fade':
+        fade_columns = max(1, round(len(colors) * SILENCE_FADE_FRACTION))
+        level = np.clip(1 - (positions - last) / fade_columns, 0, 1)
+        level[leading] = 0
+        colors = (colors * level[:, np.newaxis]).astype(np.uint8)
+    return colors
+
+def summary_colors(summary, width, mode='peak', silence='hold'):
+    """
+    (width, 3) uint8 colors of a spectral summary pooled to `width` columns, in one of
+    COLOR_MODES:
+
+    - peak: wavelength color of the loudest frame's strongest frequency
+    - centroid: wavelength color of the spectral centroid
+    - top_k: wavelength color of the weighted mean of the TOP_K strongest frequencies
+    - bands: low/mid/high band amplitude as red/green/blue
+    - loudness: peak colors dimmed by level relative to the loudest column
+
+    Silent columns are drawn by the `silence` policy, one of SILENCE_POLICIES.
+    """
+    if mode not in COLOR_MODES:
+        raise ValueError(f"Unknown color mode {mode!r}; expected one of {', '.join(COLOR_MODES)}")
+    if silence not in SILENCE_POLICIES:
+        raise ValueError(f"Unknown silence policy {silence!r}; expected one of {', '.join(SILENCE_POLICIES)}")
+    start = time.perf_counter()
+    if silence == 'trim':
+        summary = trim_silence(summary)
+    if len(summary) == 0 or width <= 0:
+        colors = np.zeros((max(width, 0), 3), dtype=np.uint8)
+    elif mode in ('peak', 'loudness'):
+        colors = map_frequencies_to_rgb_array(pool_summary(summary, width))
+        if mode == 'loudness':
+            power = _pool_sum(summary[:, _BAND_POWER].sum(axis=1, dtype=np.float64), width)
+            level_db = 10 * np.log10(np.maximum(power, 1e-30) / max(power.max(), 1e-30))
+            brightness = np.clip(1 + level_db / LOUDNESS_RANGE_DB, 0, 1)
+            colors = (colors * brightness[:, np.newaxis]).astype(np.uint8)
+    elif mode == 'bands':
+        amplitude = np.sqrt(_pool_sum(summary[:, _BAND_POWER].astype(np.float64), width))
+        strongest = amplitude.max(axis=1, keepdims=True)
+        colors = (amplitude / np.where(strongest > 0, strongest, 1) * 255).astype(np.uint8)
+    else:
+        field = SUMMARY_FIELDS.index(f"{mode}_hz")
+        power = summary[:, _BAND_POWER].sum(axis=1, dtype=np.float64)
+        colors = map_frequencies_to_rgb_array(_pool_log_frequency(summary[:, field], power, width))
+    if len(summary) and width > 0:
+        colors = apply_silence_policy(colors, _silent_columns(summary, width), silence)
+    metrics.record('color_map', time.perf_counter() - start, frames=len(summary), mode=mode)
+    return colors
+
+# Anti-aliasing filter half-length in units of max(up, down). Shorter than resample_poly's
+# default of 10, which costs twice as much without changing the colors: they only need
+# the aliased band suppressed, not a sharp transition
+DOWNSAMPLE_FILTER_HALF_LENGTH = 4
+
+@lru_cache(maxsize=16)
+def _downsample_filter(up, down):
+    """Cached float32 low-pass FIR for resample_poly by up/down"""
+    from scipy import signal
+    half_length = DOWNSAMPLE_FILTER_HALF_LENGTH * max(up, down)
+    taps = signal.firwin(2 * half_length + 1, 1 / max(up, down), window=('kaiser', 5.0)).astype(np.float32)
+    taps.flags.writeable = False
+    return taps
+
+def downsample(audio_data, sample_rate, target_rate, max_block_samples=1 << 20):
+    """
+    Mono audio decimated to `target_rate` with a polyphase anti-aliasing filter
+    (scipy.signal.resample_poly), a block at a time so memory-mapped input is never
+    converted as a whole. Integer samples stay integer. Returns (samples, sample_rate);
+    audio already at or below `target_rate` is returned unchanged.
+    """
+    if not target_rate or target_rate >= sample_rate:
+        return audio_data, sample_rate
+    from scipy import signal
+    ratio = Fraction(int(target_rate), int(sample_rate)).limit_denominator(1000)
+    up, down = ratio.numerator, ratio.denominator
+    # Block edges fall on multiples of `down` so each block maps to whole output samples, and
+    # each block is filtered with `pad` samples of context on both sides (at least the
+    # filter's half-length) so the joins match filtering the whole signal at once
+    taps = _downsample_filter(up, down)
+    pad = -(-math.ceil(DOWNSAMPLE_FILTER_HALF_LENGTH * max(up, down) / up) // down) * down
+    block = max(1, max_block_samples // down) * down
+    total = len(audio_data)
+    dtype = audio_data.dtype if np.issubdtype(audio_data.dtype, np.integer) else np.float32
+    output = np.empty(-(-total * up // down), dtype=dtype)
+
+    with metrics.stage('downsample', samples=total, sample_rate=sample_rate, target_rate=target_rate):
+        for start in range(0, total, block):
+            end = min(start + block, total)
+            low, high = max(0, start - pad), min(total, end + pad)
+            filtered = signal.resample_poly(_downmix(audio_data[low:high]), up, down, window=taps)
+            first, last = start * up // down, -(-end * up // down)
+            offset = (start - low) * up // down
+            filtered = filtered[offset:offset + last - first]
+            if np.issubdtype(dtype, np.integer):
+                info = np.iinfo(dtype)
+                filtered = np.clip(np.round(filtered), info.min, info.max)
+            output[first:last] = filtered
+    rate = sample_rate * ratio
+    return output, int(rate) if rate.denominator == 1 else float(rate)
+
+def summarize_audio(file_path, max_block_samples=1 << 20, analysis_rate=None):
+    """
+    Spectral summary of a WAV file, memory-mapped and transformed a block at a time;
+    decimated to `analysis_rate` first when that is below the file's rate
+    """
+    with metrics.stage('decode', bytes=os.path.getsize(file_path)) as info:
+        sample_rate, audio_data = read_wav_mmap(file_path)
+        info['samples'] = len(audio_data)
+    audio_data, sample_rate = downsample(audio_data, sample_rate, analysis_rate, max_block_samples)
+    summary = spectral_summary(audio_data, sample_rate, max_block_samples=max_block_samples)
+    del audio_data  # release the memory map so the file can be cleaned up
+    return summary
 
+def dominant_frequencies(audio_data, sample_rate, num_segments=1000, max_block_samples=1 << 20):
+    """
+    Dominant frequency (Hz) of each of `num_segments` equal parts of the audio: the
+    strongest bin of the part's loudest summary frame (see pool_summary)
+    """
+    return pool_summary(spectral_summary(audio_data, sample_rate, max_block_samples=max_block_samples), num_segments)
+
+def segment_colors(audio_data, sample_rate, num_segments=1000, max_block_samples=1 << 20):
+    """(N, 3) uint8 color of each of `num_segments` equal parts of the audio"""
+    return summary_colors(spectral_summary(audio_data, sample_rate, max_block_samples=max_block_samples), num_segments)
+
+def process_audio(file_path, num_segments=1000, stream=False, max_block_samples=1 << 20):
+    """
+    Colors of `num_segments` equal parts of a WAV file as an (N, 3) uint8 array, or None
+    on failure. A thin wrapper over summarize_audio and summary_colors in 'peak' mode: a
+    part's dominant frequency is that of its loudest 4096-sample frame rather than of one
+    FFT over the whole part, and silent parts hold the previous color. The file is always
+    memory-mapped; `stream` is kept for compatibility.
+    """
+    try:
+        print(f"Reading audio file: {file_path}")
+        colors = summary_colors(summarize_audio(file_path, max_block_samples), num_segments)
+        print(f"Generated {len(colors)} colors")
+        return colors
     except Exception as e:
         print(f"Audio processing error: {e}")
 
+def read_wav_mmap(file_path):
+    """Memory-map a WAV file, falling back to a regular read for formats scipy cannot map (e.g. 24-bit)"""
+    from scipy.io import wavfile
+    try:
+        return wavfile.read(file_path, mmap=True)
+    except ValueError:
+        return wavfile.read(file_path)
+
+def iter_decoded_blocks(source, sample_rate=44100, block_samples=1 << 20):
+    """
+    Decode any file ffmpeg can read into mono int16 samples at `sample_rate`, yielded in
+    blocks of up to `block_samples` as they come off the pipe, so no intermediate WAV is
+    written and the whole track is never held. Downmixing and resampling happen inside
+    ffmpeg; a failed decode raises CalledProcessError once the pipe is drained.
+    """
+    command = [
+        'ffmpeg', '-v', 'error', '-i', source,
+        '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    read_seconds = 0.0
+    total_bytes = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            data = process.stdout.read(block_samples * 2)
+            read_seconds += time.perf_counter() - start
+            if not data:
+                break
+            total_bytes += len(data)
+            yield np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        metrics.record('decode', read_seconds, bytes=total_bytes, samples=total_bytes // 2)
+
+def decode_audio(source, sample_rate=44100):
+    """
+    Decode a whole file into one mono int16 array at `sample_rate` (see
+    iter_decoded_blocks), for callers that slice it up, such as chapters and cue sheets
+    """
+    blocks = list(iter_decoded_blocks(source, sample_rate))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.int16)
+
+def summarize_decoded(source, sample_rate=44100, max_block_samples=1 << 20, silence_db=SILENCE_THRESHOLD_DB):
+    """
+    Spectral summary of any file ffmpeg can read, decoded at `sample_rate` and analysed a
+    block at a time as the samples arrive, so memory stays bounded by the block size
+    rather than the track length
+    """
+    blocks = iter_decoded_blocks(source, sample_rate, max_block_samples)
+    frame_blocks = iter_stream_frames(blocks)
+    return _summarize_frames(frame_blocks, sample_rate, SUMMARY_FRAME_LENGTH, full_scale(np.int16), silence_db)
 
 def map_frequencies_to_colors(frequencies):
     """
     Map a list of audio frequencies to RGB colors using a logarithmic scale and wavelength-based color mapping
     """
-    return [map_frequency_to_rgb(freq) for freq in frequencies]
+    return [tuple(rgb) for rgb in map_frequencies_to_rgb_array(frequencies).tolist()]
 
 def map_frequency_to_rgb(freq):
     """
     Map a single frequency (Hz) to an RGB color via a logarithmic scale mapped to wavelength (400–700nm)
     """
-    def wavelength_to_rgb(wavelength):
-        if wavelength < 380 or wavelength > 780:
-            return (0, 0, 0)
-        if wavelength < 440:
-            R = -(wavelength - 440) / (440 - 380)
-            G = 0.0
-            B = 1.0
-        elif wavelength < 490:
-            R = 0.0
-            G = (wavelength - 440) / (490 - 440)
-            B = 1.0
-        elif wavelength < 510:
-            R = 0.0
-            G = 1.0
-            B = -(wavelength - 510) / (510 - 490)
-        elif wavelength < 580:
-            R = (wavelength - 510) / (580 - 510)
-            G = 1.0
-            B = 0.0
-        elif wavelength < 645:
-            R = 1.0
-            G = -(wavelength - 645) / (645 - 580)
-            B = 0.0
-        else:
-            R = 1.0
-            G = 0.0
-            B = 0.0
-
-        if wavelength < 420:
-            factor = 0.3 + 0.7 * (wavelength - 380) / (420 - 380)
-        elif wavelength > 700:
-            factor = 0.3 + 0.7 * (780 - wavelength) / (780 - 700)
-        else:
-            factor = 1.0
+    log_min = math.log10(20)
+    log_max = math.log10(20000)
+    log_f = math.log10(max(freq, 1))
+    t = (log_f - log_min) / (log_max - log_min)
+    t = min(max(t, 0), 1)
+    wavelength = 700 - t * (700 - 400)
+    return wavelength_to_rgb(wavelength)
+
+def wavelength_to_rgb(wavelength):
+    """Scalar form of wavelengths_to_rgb_array, for single lookups"""
+    if wavelength < 380 or wavelength > 780:
+        return (0, 0, 0)
+    if wavelength < 440:
+        R = -(wavelength - 440) / (440 - 380)
+        G = 0.0
+        B = 1.0
+    elif wavelength < 490:
+        R = 0.0
+        G = (wavelength - 440) / (490 - 440)
+        B = 1.0
+    elif wavelength < 510:
+        R = 0.0
+        G = 1.0
+        B = -(wavelength - 510) / (510 - 490)
+    elif wavelength < 580:
+        R = (wavelength - 510) / (580 - 510)
+        G = 1.0
+        B = 0.0
+    elif wavelength < 645:
+        R = 1.0
+        G = -(wavelength - 645) / (645 - 580)
+        B = 0.0
+    else:
+        R = 1.0
+        G = 0.0
+        B = 0.0
+
+    if wavelength < 420:
+        factor = 0.3 + 0.7 * (wavelength - 380) / (420 - 380)
+    elif wavelength > 700:
+        factor = 0.3 + 0.7 * (780 - wavelength) / (780 - 700)
+    else:
+        factor = 1.0
+
+    R = int(max(0, min(255, R * factor * 255)))
+    G = int(max(0, min(255, G * factor * 255)))
+    B = int(max(0, min(255, B * factor * 255)))
+    return (R, G, B)
+
+def map_frequencies_to_rgb_array(freqs):
+    """Vectorized map_frequency_to_rgb: array of frequencies (Hz) -> (N, 3) uint8 RGB array"""
+    return wavelengths_to_rgb_array(frequencies_to_wavelengths(freqs))
 
-        R = int(max(0, min(255, R * factor * 255)))
-        G = int(max(0, min(255, G * factor * 255)))
-        B = int(max(0, min(255, B * factor * 255)))
-        return (R, G, B)
+@lru_cache(maxsize=16)
+def bin_color_table(length, sample_rate):
+    """Precomputed RGB color of every rfft bin for a frame length and sample rate"""
+    table = map_frequencies_to_rgb_array(_frequency_axis(length, sample_rate))
+    table.flags.writeable = False
+    return table
 
+def frequencies_to_wavelengths(freqs):
+    """Logarithmic 20 Hz–20 kHz -> 700–400 nm mapping"""
     log_min = np.log10(20)
     log_max = np.log10(20000)
-    log_f = np.log10(max(freq, 1))
+    log_f = np.log10(np.maximum(np.asarray(freqs, dtype=np.float64), 1))
     t = (log_f - log_min) / (log_max - log_min)
     t = np.clip(t, 0, 1)
-    wavelength = 700 - t * (700 - 400)
-    return wavelength_to_rgb(wavelength)
+    return 700 - t * (700 - 400)
+
+def wavelengths_to_rgb_array(wavelengths):
+    """Piecewise-linear visible spectrum approximation, evaluated over an array of wavelengths (nm)"""
+    w = np.asarray(wavelengths, dtype=np.float64)
+    bands = [w < 440, w < 490, w < 510, w < 580, w < 645]
+    R = np.select(bands, [-(w - 440) / (440 - 380), 0.0, 0.0, (w - 510) / (580 - 510), 1.0], 1.0)
+    G = np.select(bands, [0.0, (w - 440) / (490 - 440), 1.0, 1.0, -(w - 645) / (645 - 580)], 0.0)
+    B = np.select(bands, [1.0, 1.0, -(w - 510) / (510 - 490), 0.0, 0.0], 0.0)
+
+    factor = np.select(
+        [w < 420, w > 700],
+        [0.3 + 0.7 * (w - 380) / (420 - 380), 0.3 + 0.7 * (780 - w) / (780 - 700)],
+        1.0
+    )
+
+    rgb = np.stack([R, G, B], axis=-1) * factor[..., np.newaxis] * 255
+    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+    rgb[(w < 380) | (w > 780)] = 0
+    return rgb
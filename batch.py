@@ -0,0 +1,238 @@
+"""
+Render many albums from a manifest in one process.
+
+The manifest is a CSV file with a header row, or a JSON-lines file with one object per
+line. Each entry gives one of `url`, `query` or `folder`, and optionally `color`
+("r,g,b" or "auto"), `selection_index`, `output_dir`, `width`, `extra_widths`
+("320,3840"), `color_mode`, `extra_color_modes` ("bands,centroid"), `silence`
+("hold", "fade" or "trim"), `analysis_rate` (Hz) and `id` (the journal key; defaults
+to the url, query or folder plus the options the entry sets). An unquoted color must be
+the last CSV column:
+
+    url,color
+    https://www.youtube.com/playlist?list=...,30,30,30
+    https://www.youtube.com/watch?v=...,auto
+
+Entries rendering the same source more than once (e.g. in two colors) each write to a
+subfolder named after their `id`, or `job<N>` for the Nth manifest entry, unless they
+set `output_dir`. Other jobs running at once that resolve to the same album folder
+(different sources with the same title) get numbered folders, `<title>_2` and so on.
+
+    python batch.py albums.csv --jobs 2 --workers 4
+
+All jobs share one Pipeline, so the analysis cache, the process pool, the thumbnail
+session and cover cache, loaded fonts and window/color tables, and the per-thread
+YoutubeDL metadata instances stay warm from one album to the next. Each finished job
+is appended to a journal (by default `<manifest>.journal.jsonl`); rerunning the same
+command skips journalled jobs, so a batch that failed part-way resumes where it stopped.
+"""
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import analysis_cache
+import thumbnails
+from config import parse_color, parse_count, parse_list, parse_width, parse_widths, sanitize_filename
+from pipeline import JobConfig, Pipeline
+
+def read_manifest(path):
+    """
+    Manifest entries as dicts, from a .csv (header row) or JSON-lines file. In a CSV an
+    unquoted "r,g,b" color spills into extra columns, which is only unambiguous when
+    `color` is the last column; otherwise the color must be quoted.
+    """
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            entries = []
+            reader = csv.DictReader(f, restkey='_rest')
+            for row in reader:
+                rest = row.pop('_rest', None)
+                if rest:
+                    if reader.fieldnames[-1] != 'color':
+                        raise ValueError(f"{path}, line {reader.line_num}: more values than columns; "
+                                         f"quote colors that are not in the last column, e.g. \"30,30,30\"")
+                    row['color'] = ",".join([row['color']] + rest)
+                entries.append({key: value for key, value in row.items() if value not in (None, "")})
+            return entries
+        return [json.loads(line) for line in f if line.strip()]
+
+# Entry fields besides the source that change what a job renders
+JOB_OPTIONS = ('selection_index', 'color', 'width', 'extra_widths', 'color_mode', 'extra_color_modes',
+               'silence', 'analysis_rate', 'output_dir')
+
+def job_source(entry):
+    """The url, query or folder a manifest entry renders"""
+    return str(entry.get('url') or entry.get('query') or entry.get('folder'))
+
+def job_key(entry):
+    """
+    Journal key for a manifest entry: its `id`, or its source followed by any JOB_OPTIONS
+    it sets, so the same album in two colors or modes is two jobs
+    """
+    if entry.get('id'):
+        return str(entry['id'])
+    options = [f"{name}={entry[name]}" for name in JOB_OPTIONS if entry.get(name) not in (None, "")]
+    return job_source(entry) + (f" [{', '.join(options)}]" if options else "")
+
+def job_config(entry, output_dir=None, **render_defaults):
+    """
+    JobConfig for a manifest entry. `render_defaults` (width, extra_widths, color_mode,
+    extra_color_modes, silence, analysis_rate) apply unless the entry sets its own.
+    """
+    selection_index = entry.get('selection_index')
+    options = dict(render_defaults)
+    if entry.get('width'):
+        options['width'] = parse_width(entry['width'])
+    if entry.get('analysis_rate'):
+        options['analysis_rate'] = int(entry['analysis_rate'])
+    for name in ('color_mode', 'silence'):
+        if entry.get(name):
+            options[name] = entry[name]
+    if 'extra_widths' in entry:
+        options['extra_widths'] = parse_widths(entry['extra_widths'])
+    if 'extra_color_modes' in entry:
+        options['extra_color_modes'] = parse_list(entry['extra_color_modes'])
+    return JobConfig(
+        query=entry.get('query'),
+        url=entry.get('url'),
+        folder=entry.get('folder'),
+        selection_index=int(selection_index) if selection_index not in (None, "") else None,
+        bg_color=parse_color(entry.get('color')),
+        output_dir=entry.get('output_dir') or output_dir,
+        **options
+    )
+
+class Journal:
+    """Append-only JSON-lines record of completed jobs"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def completed(self):
+        """Keys of the jobs already journalled"""
+        if not os.path.exists(self.path):
+            return set()
+        keys = set()
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    keys.add(json.loads(line)['key'])
+                except (ValueError, KeyError):
+                    pass  # a line cut short by a crash
+        return keys
+
+    def add(self, key, result):
+        record = {
+            'key': key,
+            'album_title': result.album_title,
+            'combined_path': result.combined_path,
+            'finished': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+
+def run_batch(entries, journal, jobs=1, output_dir=None, recorder=None, render_defaults=None,
+              **pipeline_options):
+    """
+    Run manifest `entries`, `jobs` at a time, on one shared Pipeline. Entries already in
+    the `journal` are skipped and each success is journalled. Returns the keys that failed.
+    `render_defaults` are the job_config image options for entries that do not set their own.
+    """
+    recorder = recorder or metrics.Recorder()
+    done = journal.completed()
+    pending = [(number, entry) for number, entry in enumerate(entries, start=1) if job_key(entry) not in done]
+    print(f"[INFO] {len(entries)} jobs in manifest, {len(entries) - len(pending)} already done, {len(pending)} to run")
+    sources = Counter(job_source(entry) for entry in entries)
+    failed = []
+
+    def run_entry(pipeline, position, number, entry):
+        key = job_key(entry)
+        print(f"[INFO] Job {position}/{len(pending)}: {key}")
+        entry_output_dir = output_dir
+        if sources[job_source(entry)] > 1 and not entry.get('output_dir'):
+            # Entries rendering the same album would share its output folder; each gets a subfolder
+            subfolder = sanitize_filename(str(entry.get('id') or f"job{number}"))
+            entry_output_dir = os.path.join(output_dir or os.getcwd(), subfolder)
+        try:
+            with metrics.labels(job=key):
+                result = pipeline.run(job_config(entry, entry_output_dir, **(render_defaults or {})), recorder=recorder)
+            if not result.combined_path:
+                raise RuntimeError("no combined image was written")
+            journal.add(key, result)
+            for path in [result.combined_path, *result.extra_combined_paths.values()]:
+                print(f"[OUTPUT] {path}", flush=True)
+        except Exception as e:
+            print(f"[ERROR] Job failed: {key}: {e}")
+            failed.append(key)
+
+    with Pipeline(**pipeline_options) as pipeline, ThreadPoolExecutor(max_workers=jobs) as executor:
+        for position, (number, entry) in enumerate(pending, start=1):
+            executor.submit(run_entry, pipeline, position, number, entry)
+
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render album visualizations for every entry in a manifest")
+    parser.add_argument("manifest", help="CSV or JSON-lines manifest of url/query/folder entries")
+    parser.add_argument("--jobs", type=parse_count, default=1, help="Albums processed concurrently")
+    parser.add_argument("--workers", type=parse_count, default=1, help="Analysis processes shared by all jobs")
+    parser.add_argument("--download-workers", type=parse_count, default=2, help="Concurrent downloads per job")
+    parser.add_argument("--queue-depth", type=parse_count, default=2,
+                        help="Decoded tracks buffered between download and analysis, per job")
+    parser.add_argument("--output-dir", default=None,
+                        help="Folder for album output unless an entry sets output_dir (default: current directory)")
+    parser.add_argument("--width", type=int, default=None, help="Track image width in px (default: 775)")
+    parser.add_argument("--extra-widths", type=parse_widths, default=(),
+                        help="Comma-separated widths of additional combined images, e.g. 320,3840")
+    parser.add_argument("--color-mode", default="peak", help="peak, centroid, top_k, bands or loudness")
+    parser.add_argument("--extra-color-modes", type=parse_list, default=(),
+                        help="Comma-separated color modes of additional combined images, e.g. bands,centroid")
+    parser.add_argument("--silence", default="hold",
+                        help="How silent stretches are drawn: hold, fade or trim (unless an entry sets its own)")
+    parser.add_argument("--analysis-rate", type=int, default=None,
+                        help="Decimate audio to this rate (Hz) before analysis unless an entry sets its own")
+    parser.add_argument("--local-media", default=os.environ.get("AUDIOVISUALIZER_LOCAL_MEDIA"),
+                        help="Serve searches and downloads from this folder instead of YouTube "
+                             "(default: $AUDIOVISUALIZER_LOCAL_MEDIA)")
+    parser.add_argument("--journal", default=None, help="Completed-jobs journal (default: <manifest>.journal.jsonl)")
+    parser.add_argument("--metrics-jsonl", default=None, help="Append per-stage timing events to this JSON-lines file")
+    args = parser.parse_args(argv)
+
+    journal = Journal(args.journal or args.manifest + ".journal.jsonl")
+    recorder = metrics.Recorder()
+    sink = metrics.JsonLinesSink(args.metrics_jsonl) if args.metrics_jsonl else None
+    if sink:
+        recorder.subscribe(sink)
+    try:
+        failed = run_batch(
+            read_manifest(args.manifest), journal, args.jobs, args.output_dir, recorder,
+            render_defaults={
+                'width': args.width, 'extra_widths': args.extra_widths,
+                'color_mode': args.color_mode, 'extra_color_modes': args.extra_color_modes,
+                'silence': args.silence, 'analysis_rate': args.analysis_rate,
+            },
+            workers=args.workers, download_workers=args.download_workers, queue_depth=args.queue_depth,
+            cache=analysis_cache.get_default_cache(), thumbnails=thumbnails.get_default_fetcher(),
+            media_dir=args.local_media
+        )
+    finally:
+        if sink:
+            sink.close()
+
+    if recorder.events:
+        print("[METRICS] Stage timings:\n" + recorder.format_summary())
+    if failed:
+        print(f"[ERROR] {len(failed)} jobs failed; rerun the same command to retry them")
+        return 1
+    print("[INFO] Batch complete")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,326 @@
+"""
+Benchmarks for the analysis and rendering hot paths.
+
+Generates synthetic WAV files, times each stage and writes the results to JSON so runs
+can be compared across releases (e.g. after a yt-dlp or SciPy upgrade):
+
+    python benchmark.py --output benchmark_results.json
+    python benchmark.py --quick
+
+Each result records the best and mean wall time over `repeat` runs, throughput in
+audio-seconds per second where audio is involved, and peak traced memory (Python and
+NumPy allocations, via tracemalloc) for one extra run.
+
+The downsampling benchmark times analysis at each of DOWNSAMPLE_RATES against the
+full-rate analysis of the same file, along the pipeline's WAV (block-wise decimation)
+and ffmpeg decode paths, and reports how closely its colors match, per color mode, so
+the speed/accuracy trade-off of `--analysis-rate` can be judged:
+
+    python benchmark.py --downsample-only --quick
+
+Startup is measured separately with `python -X importtime` for each entry point and
+checked against STARTUP_BUDGET_S; the run exits non-zero when an entry point goes over
+budget, e.g. after a change re-introduces a heavy import at module level.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import subprocess
+import platform
+import tempfile
+import argparse
+import contextlib
+import tracemalloc
+import numpy as np
+from scipy.io import wavfile
+
+import audio_processing
+import visualization
+
+# (duration in seconds, sample rate, channels)
+WAV_CASES = [
+    (30, 44100, 2),
+    (180, 44100, 2),
+    (180, 48000, 1),
+    (600, 96000, 2),
+]
+QUICK_WAV_CASES = [
+    (30, 44100, 2),
+    (60, 48000, 1),
+]
+
+# Analysis rates compared against full-rate analysis, and the per-channel difference
+# under which a column's color counts as matching
+DOWNSAMPLE_RATES = (32000, 22050, 16000, 11025)
+COLOR_TOLERANCE = 16
+
+# Seconds of import time allowed per entry point (module import only, not interpreter start).
+# SciPy, yt-dlp and requests are imported lazily, so these cover NumPy, PIL and our own modules.
+STARTUP_BUDGET_S = {
+    'consoleMain': 0.4,
+    'batch': 0.4,
+    'RUNME': 0.6,
+}
+
+def write_synthetic_wav(path, duration, sample_rate, channels, seed=0):
+    """Write a 16-bit WAV of a rising chirp plus noise, so dominant frequencies vary over the track"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    freq = 40 * (400 ** (t / duration))  # 40 Hz -> 16 kHz
+    phase = 2 * np.pi * np.cumsum(freq) / sample_rate
+    mono = 0.5 * np.sin(phase) + rng.normal(0, 0.05, len(t))
+    samples = np.clip(mono * 32767, -32768, 32767).astype(np.int16)
+    if channels > 1:
+        samples = np.repeat(samples[:, np.newaxis], channels, axis=1)
+    wavfile.write(path, sample_rate, samples)
+    return path
+
+def measure(name, fn, repeat=3, audio_seconds=None, **params):
+    """Time `fn` (its stdout suppressed) and return a result record"""
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min(times)
+    result = {
+        'name': name,
+        'params': params,
+        'repeat': repeat,
+        'best_s': best,
+        'mean_s': sum(times) / len(times),
+        'peak_memory_bytes': peak_memory,
+    }
+    if audio_seconds:
+        result['audio_seconds'] = audio_seconds
+        result['throughput_audio_s_per_s'] = audio_seconds / best
+    print(f"{name:<28} {json.dumps(params):<55} best {best * 1000:9.1f} ms"
+          f"  peak {peak_memory / 2**20:7.1f} MiB"
+          + (f"  {result['throughput_audio_s_per_s']:8.0f} audio-s/s" if audio_seconds else ""))
+    return result
+
+def bench_analysis(workdir, wav_cases, repeat, width=visualization.TRACK_WIDTH):
+    """Spectral summary of in-memory and memory-mapped audio, and pooling it to one width"""
+    results = []
+    for duration, sample_rate, channels in wav_cases:
+        path = write_synthetic_wav(os.path.join(workdir, f"bench_{duration}_{sample_rate}_{channels}.wav"),
+                                   duration, sample_rate, channels)
+        params = {'duration': duration, 'sample_rate': sample_rate, 'channels': channels}
+        _, audio_data = wavfile.read(path)
+        results.append(measure('spectral_summary', lambda: audio_processing.spectral_summary(audio_data, sample_rate),
+                               repeat, audio_seconds=duration, **params))
+        results.append(measure('summarize_audio[mmap]', lambda: audio_processing.summarize_audio(path),
+                               repeat, audio_seconds=duration, **params))
+        summary = audio_processing.summarize_audio(path)
+        results.append(measure('summary_colors', lambda: audio_processing.summary_colors(summary, width),
+                               repeat, width=width, **params))
+    return results
+
+def color_accuracy(reference, colors):
+    """How closely a (width, 3) color row matches a reference row"""
+    difference = np.abs(reference.astype(np.int16) - colors.astype(np.int16))
+    return {
+        'mean_rgb_distance': float(np.linalg.norm(difference, axis=1).mean()),
+        'matching_columns': float((difference.max(axis=1) <= COLOR_TOLERANCE).mean()),
+    }
+
+def bench_downsample(workdir, wav_cases, repeat, rates=DOWNSAMPLE_RATES, width=visualization.TRACK_WIDTH):
+    """
+    Analysis time at each of `rates` and its color accuracy against full-rate analysis,
+    along both decode paths the pipeline takes: WAVs memory-mapped and decimated by
+    audio_processing.downsample, and everything else decoded at the rate by ffmpeg
+    (skipped when ffmpeg is missing)
+    """
+    have_ffmpeg = shutil.which('ffmpeg') is not None
+    if not have_ffmpeg:
+        print("summarize_decoded: skipped (ffmpeg not found)")
+    results = []
+    for duration, sample_rate, channels in wav_cases:
+        path = write_synthetic_wav(os.path.join(workdir, f"bench_{duration}_{sample_rate}_{channels}.wav"),
+                                   duration, sample_rate, channels)
+        params = {'duration': duration, 'sample_rate': sample_rate, 'channels': channels}
+        full = audio_processing.summarize_audio(path)
+        reference = {mode: audio_processing.summary_colors(full, width, mode) for mode in audio_processing.COLOR_MODES}
+        results.append(measure('summarize_audio', lambda: audio_processing.summarize_audio(path),
+                               repeat, audio_seconds=duration, **params))
+        paths = [('summarize_audio[downsample]', lambda rate: audio_processing.summarize_audio(path, analysis_rate=rate))]
+        if have_ffmpeg:
+            paths.append(('summarize_decoded', lambda rate: audio_processing.summarize_decoded(path, rate)))
+        for rate in rates:
+            if rate >= sample_rate:
+                continue
+            for name, summarize in paths:
+                result = measure(name, lambda: summarize(rate), repeat, audio_seconds=duration,
+                                 analysis_rate=rate, **params)
+                summary = summarize(rate)
+                result['accuracy'] = {
+                    mode: color_accuracy(reference[mode], audio_processing.summary_colors(summary, width, mode))
+                    for mode in audio_processing.COLOR_MODES
+                }
+                print("    " + "  ".join(
+                    f"{mode} {accuracy['matching_columns']:6.1%} match ({accuracy['mean_rgb_distance']:5.1f} mean RGB distance)"
+                    for mode, accuracy in result['accuracy'].items()
+                ))
+                results.append(result)
+    return results
+
+def bench_color_mapping(repeat):
+    freqs = np.geomspace(20, 20000, 1000)
+    return [
+        measure('map_frequency_to_rgb', lambda: [audio_processing.map_frequency_to_rgb(f) for f in freqs],
+                repeat, count=len(freqs)),
+        measure('map_frequencies_to_rgb_array', lambda: audio_processing.map_frequencies_to_rgb_array(freqs),
+                repeat, count=len(freqs)),
+    ]
+
+def bench_rendering(workdir, repeat, num_tracks=12):
+    colors = audio_processing.map_frequencies_to_rgb_array(np.geomspace(20, 20000, 1000))
+    gradient = visualization.create_gradient_image(colors, height=200, target_width=1000)
+    track_path = os.path.join(workdir, 'bench_track.png')
+    track_paths = []
+    for idx in range(num_tracks):
+        path = os.path.join(workdir, f"{idx + 1:02d}_Track {idx + 1}.png")
+        with contextlib.redirect_stdout(io.StringIO()):
+            visualization.create_track_visualization(gradient, f"Track {idx + 1}", path)
+        track_paths.append(path)
+
+    return [
+        measure('create_gradient_image',
+                lambda: visualization.create_gradient_image(colors, height=200, target_width=1000), repeat),
+        measure('create_track_visualization',
+                lambda: visualization.create_track_visualization(gradient, 'Benchmark Track', track_path), repeat),
+        measure('stack_images_with_margin',
+                lambda: visualization.stack_images_with_margin(track_paths, margin=5, border=30,
+                                                               bg_color=(30, 30, 30), album_title='Benchmark Album'),
+                repeat, tracks=num_tracks),
+    ]
+
+def bench_pipeline(workdir, repeat, num_tracks=4, duration=60, workers=1):
+    """Full pipeline run against LocalYoutubeDL serving synthetic tracks (needs ffmpeg)"""
+    if shutil.which('ffmpeg') is None:
+        print("pipeline: skipped (ffmpeg not found)")
+        return []
+    from pipeline import JobConfig, run_job
+
+    media_dir = os.path.join(workdir, 'BenchAlbum')
+    os.makedirs(media_dir, exist_ok=True)
+    for idx in range(num_tracks):
+        write_synthetic_wav(os.path.join(media_dir, f"track{idx + 1:02d}.wav"), duration, 44100, 2, seed=idx)
+
+    run_dir = os.path.join(workdir, 'pipeline')
+    os.makedirs(run_dir, exist_ok=True)
+    config = JobConfig(url='https://www.youtube.com/playlist?list=BenchAlbum', bg_color=(30, 30, 30),
+                       output_dir=run_dir)
+
+    def run():
+        run_job(config, workers=workers, media_dir=media_dir)
+
+    return [measure('pipeline', run, repeat, audio_seconds=num_tracks * duration,
+                    tracks=num_tracks, track_duration=duration, workers=workers)]
+
+def import_time(module, repeat):
+    """
+    Best cumulative import time of `module` in a fresh interpreter over `repeat` runs, from
+    `-X importtime`, plus the five slowest imports (by their own time) of the best run
+    """
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            return None, proc.stderr.strip().splitlines()[-1]
+        rows = []
+        for line in proc.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line and 'self' not in line:
+                self_us, cumulative_us, name = line[len('import time:'):].split('|')
+                rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+        total = next(cumulative for _, cumulative, name in rows if name == f" {module}")
+        if best is None or total < best[0]:
+            best = (total, sorted(rows, reverse=True)[:5])
+    total, slowest = best
+    return total / 1e6, [{'module': name.strip(), 'self_s': self_us / 1e6} for self_us, _, name in slowest]
+
+def bench_startup(repeat):
+    """Import time of each entry point against its STARTUP_BUDGET_S"""
+    results = []
+    for module, budget in STARTUP_BUDGET_S.items():
+        seconds, detail = import_time(module, repeat)
+        if seconds is None:
+            print(f"startup[{module}]: skipped ({detail})")
+            continue
+        within_budget = seconds <= budget
+        print(f"{'startup[' + module + ']':<28} {seconds * 1000:9.1f} ms  budget {budget * 1000:.0f} ms"
+              + ("" if within_budget else "  OVER BUDGET"))
+        results.append({
+            'name': 'startup',
+            'params': {'module': module},
+            'import_s': seconds,
+            'budget_s': budget,
+            'within_budget': within_budget,
+            'slowest_imports': detail,
+        })
+    return results
+
+def environment_info():
+    import scipy
+    import PIL
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'pillow': PIL.__version__,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the audio analysis and rendering hot paths")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write results to")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark")
+    parser.add_argument("--quick", action="store_true", help="Shorter synthetic tracks, for smoke runs")
+    parser.add_argument("--skip-pipeline", action="store_true", help="Skip the full pipeline benchmark")
+    parser.add_argument("--startup-only", action="store_true", help="Only measure entry point import times")
+    parser.add_argument("--downsample-only", action="store_true",
+                        help="Only compare downsampled analysis against full rate")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="audiovisualizer-bench-")
+    try:
+        wav_cases = QUICK_WAV_CASES if args.quick else WAV_CASES
+        results = [] if args.downsample_only else bench_startup(args.repeat)
+        if args.downsample_only:
+            results += bench_downsample(workdir, wav_cases, args.repeat)
+        elif not args.startup_only:
+            results += bench_analysis(workdir, wav_cases, args.repeat)
+            results += bench_downsample(workdir, wav_cases, args.repeat)
+            results += bench_color_mapping(args.repeat)
+            results += bench_rendering(workdir, args.repeat)
+            if not args.skip_pipeline:
+                results += bench_pipeline(workdir, args.repeat, duration=20 if args.quick else 60)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'environment': environment_info(), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    report = main()
+    over_budget = [r['params']['module'] for r in report['results'] if r.get('within_budget') is False]
+    if over_budget:
+        print(f"Startup over budget: {', '.join(over_budget)}")
+        sys.exit(1)
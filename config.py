@@ -1,10 +1,58 @@
 import re
+import os
+import json
 import math
+import threading
+from functools import lru_cache
 
 def sanitize_filename(filename):
     """Remove characters not allowed in Windows filenames"""
     return re.sub(r'[<>:"/\\|?*]', '', filename)
 
+def parse_list(value, item=str):
+    """Items from "a,b" or a list, converted by `item`; () when empty"""
+    if not value:
+        return ()
+    parts = value.split(",") if isinstance(value, str) else value
+    parts = [x.strip() if isinstance(x, str) else x for x in parts]
+    return tuple(item(x) for x in parts if x != "")
+
+def parse_width(value):
+    """Positive image width from "320" or 320"""
+    try:
+        width = int(value)
+    except (TypeError, ValueError):
+        width = 0
+    if width <= 0:
+        raise ValueError(f"Invalid image width: {value}")
+    return width
+
+def parse_count(value):
+    """Positive count (workers, jobs, queue depth) from "4" or 4"""
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        count = 0
+    if count <= 0:
+        raise ValueError(f"Invalid count: {value}")
+    return count
+
+def parse_widths(value):
+    """Image widths from "320,3840" or a list of ints"""
+    return parse_list(value, parse_width)
+
+def parse_color(value):
+    """(r, g, b) from "r,g,b" or a 3-item list; None for empty or "auto\""""
+    if not value or (isinstance(value, str) and value.strip().lower() == "auto"):
+        return None
+    try:
+        color = parse_list(value, int)
+    except ValueError:
+        color = ()
+    if len(color) != 3 or not all(0 <= c <= 255 for c in color):
+        raise ValueError(f"Invalid color: {value}")
+    return color
+
 def wavelength_to_rgb(wavelength):
     """Convert a wavelength to an RGB color value"""
     gamma = 0.8
@@ -59,11 +107,83 @@ def get_text_color(bg_color):
     # Return white for dark backgrounds, black for light backgrounds
     return (0, 0, 0) if brightness > 0.5 else (255, 255, 255)
 
+# System font directories (as scanned by matplotlib); a change to the modification time of
+# any of them or of any directory below them invalidates the persisted font lookup cache
+FONT_DIRECTORIES = [
+    "/usr/share/fonts/", "/usr/local/share/fonts/", "/usr/lib/X11/fonts/TrueType/",
+    "~/.local/share/fonts", "~/.fonts",
+    "/Library/Fonts/", "/Network/Library/Fonts/", "/System/Library/Fonts/",
+    "/opt/local/share/fonts", "~/Library/Fonts",
+    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+    os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "Windows", "Fonts"),
+]
+FONT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "audiovisualizer", "fonts.json")
+
+_font_paths = {}
+_font_paths_lock = threading.Lock()
+
+def _font_directories_mtime():
+    # Subdirectories too: installing into e.g. /usr/share/fonts/truetype/foo/ leaves the top level untouched
+    latest = 0
+    for top in map(os.path.expanduser, FONT_DIRECTORIES):
+        for directory, _, _ in os.walk(top):
+            try:
+                latest = max(latest, os.path.getmtime(directory))
+            except OSError:
+                pass
+    return latest
+
+def _load_font_cache(dirs_mtime):
+    try:
+        with open(FONT_CACHE_PATH) as f:
+            cache = json.load(f)
+        if cache.get("dirs_mtime") == dirs_mtime:
+            return cache.get("fonts", {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+def _save_font_cache(dirs_mtime, fonts):
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_PATH), exist_ok=True)
+        with open(FONT_CACHE_PATH, "w") as f:
+            json.dump({"dirs_mtime": dirs_mtime, "fonts": fonts}, f)
+    except OSError as e:
+        print(f"Could not save font cache: {e}")
+
 def get_font_path_from_matplotlib(font_name):
+    """
+    Font path for `font_name`, cached for the process and persisted across runs in
+    FONT_CACHE_PATH. The system font scan only runs when the font has not been looked
+    up before or the font directories have changed since.
+    """
+    key = font_name.lower()
+    with _font_paths_lock:
+        if key in _font_paths:
+            return _font_paths[key]
+
+        dirs_mtime = _font_directories_mtime()
+        persisted = _load_font_cache(dirs_mtime)
+        font_path = persisted.get(key)
+        if not font_path or not os.path.exists(font_path):
+            font_path = find_font_path(font_name)
+            if font_path:
+                persisted[key] = font_path
+                _save_font_cache(dirs_mtime, persisted)
+
+        _font_paths[key] = font_path
+        return font_path
+
+@lru_cache(maxsize=128)
+def load_font(font_path, size):
+    """Loaded FreeType font, shared by (path, size) so fit loops don't re-open the file"""
+    from PIL import ImageFont
+    return ImageFont.truetype(font_path, size)
+
+def find_font_path(font_name):
     """Use matplotlib's font manager to find a font path"""
     try:
         import matplotlib.font_manager as fm
-        import os
         # Get a list of all fonts matplotlib can find
         font_files = fm.findSystemFonts(fontpaths=None)
         
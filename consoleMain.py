@@ -1,157 +1,167 @@
 import os
 import sys
-import audio_processing
-import visualization
-import youtube_utils
-from config import sanitize_filename
-from PIL import Image
-import requests
-from io import BytesIO
-import numpy as np
-from visualization import get_dominant_color
+import metrics
+import analysis_cache
+import thumbnails
+from config import parse_color, parse_count, parse_list, parse_widths
+from pipeline import JobConfig, PipelineError, run_job
+
+def get_env_int(name, default):
+    """Positive integer setting from an AUDIOVISUALIZER_* environment variable"""
+    value = os.environ.get(name, "")
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    return default
+
+def get_worker_count():
+    """Number of parallel track workers from AUDIOVISUALIZER_WORKERS (default 1)"""
+    return get_env_int("AUDIOVISUALIZER_WORKERS", 1)
+
+def get_local_media():
+    """Folder served by youtube_utils.LocalYoutubeDL instead of YouTube, from AUDIOVISUALIZER_LOCAL_MEDIA"""
+    return os.environ.get("AUDIOVISUALIZER_LOCAL_MEDIA") or None
+
+def get_env_color(name="AUDIOVISUALIZER_COLOR"):
+    """(r, g, b) from an "r,g,b" environment variable; None for unset, "auto" or invalid values"""
+    env_color = os.environ.get(name)
+    try:
+        return parse_color(env_color)
+    except ValueError:
+        print(f"[WARN] Invalid custom color input: {env_color}")
+        return None
 
-def consoleMain():
+def get_env_widths(name):
+    """Image widths from a comma-separated environment variable; () for unset or invalid values"""
+    try:
+        return parse_widths(os.environ.get(name))
+    except ValueError as e:
+        print(f"[WARN] {e}")
+        return ()
+
+def render_options_from_env(width=None, extra_widths=None, color_mode=None, extra_color_modes=None, silence=None,
+                            analysis_rate=None):
+    """
+    JobConfig image and analysis options; any not given come from AUDIOVISUALIZER_WIDTH,
+    AUDIOVISUALIZER_EXTRA_WIDTHS, AUDIOVISUALIZER_COLOR_MODE,
+    AUDIOVISUALIZER_EXTRA_COLOR_MODES, AUDIOVISUALIZER_SILENCE and
+    AUDIOVISUALIZER_ANALYSIS_RATE
+    """
+    return {
+        'width': width or get_env_int("AUDIOVISUALIZER_WIDTH", None),
+        'extra_widths': get_env_widths("AUDIOVISUALIZER_EXTRA_WIDTHS") if extra_widths is None else extra_widths,
+        'color_mode': color_mode or os.environ.get("AUDIOVISUALIZER_COLOR_MODE") or "peak",
+        'extra_color_modes': parse_list(os.environ.get("AUDIOVISUALIZER_EXTRA_COLOR_MODES"))
+                             if extra_color_modes is None else extra_color_modes,
+        'silence': silence or os.environ.get("AUDIOVISUALIZER_SILENCE") or "hold",
+        'analysis_rate': analysis_rate or get_env_int("AUDIOVISUALIZER_ANALYSIS_RATE", None),
+    }
+
+def job_config_from_env(user_input=None, **render_options):
+    """
+    JobConfig from `user_input` or the AUDIOVISUALIZER_* variables, prompting for a query
+    when neither is set. An input naming an existing file or folder is a local job.
+    Image options not given (see render_options_from_env) come from the environment.
+    """
+    bg_color = get_env_color()
+    options = render_options_from_env(**render_options)
     direct_url = os.environ.get("AUDIOVISUALIZER_DIRECT_URL")
-    if direct_url:
-        print(f"[INFO] Loading direct URL: {direct_url}")
-        result = youtube_utils.load_youtube_url(direct_url)
-        user_input = direct_url
-    else:
-        user_input = os.environ.get("AUDIOVISUALIZER_INPUT")
-        if not user_input:
-            user_input = input("Enter YouTube URL or album/song name: ").strip()
-        print(f"[INFO] Searching for '{user_input}'...")
-        selection_index = os.environ.get("AUDIOVISUALIZER_SELECTION_INDEX")
-        selection_index = int(selection_index) if selection_index and selection_index.isdigit() else None
-        result = youtube_utils.search_youtube_playlist(user_input, selection_index=selection_index)
-
-    if not result:
-        print("[ERROR] No results found. Please try a different search (Likely copyright error, can usually get around this by using a URL instead).")
-        sys.exit(1)
-
-    album_title = result.get('title', user_input)
-    output_folder = os.path.join(os.getcwd(), sanitize_filename(album_title))
-    os.makedirs(output_folder, exist_ok=True)
-    print(f"[INFO] Saving to folder: {output_folder}")
-
-    bg_color = None
-    video_id = result.get('id') or (result['entries'][0].get('id') if 'entries' in result else None)
-    if video_id:
-        thumb_urls = [
-            f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
-            f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-        ]
-        for url in thumb_urls:
-            try:
-                response = requests.get(url)
-                if response.status_code == 200:
-                    cover_image = Image.open(BytesIO(response.content))
-                    bg_color = get_dominant_color([cover_image])
-                    print(f"[INFO] Auto-detected background color from album cover: RGB{bg_color}")
-                    break
-            except Exception as e:
-                print(f"[WARN] Thumbnail fetch failed for {url}: {e}")
-        else:
-            print("[WARN] No usable thumbnail found, using fallback background color.")
-
-    env_color = os.environ.get("AUDIOVISUALIZER_COLOR")
-    if env_color and env_color.lower() != "auto":
-        try:
-            parts = tuple(int(x) for x in env_color.split(","))
-            if len(parts) == 3:
-                bg_color = parts
-                print(f"[INFO] Custom background color from GUI: RGB{bg_color}")
-        except Exception as e:
-            print(f"[WARN] Invalid custom color input: {env_color}")
-
-    if 'entries' in result:
-        print(f"[INFO] Found playlist: {result.get('title')} with {len(result['entries'])} tracks")
-        tracks = youtube_utils.extract_tracks_from_playlist(result)
-    elif 'chapters' in result:
-        print(f"[INFO] Found chaptered video: {result.get('title')}")
-        tracks = youtube_utils.split_album_video(result, output_folder)
-    else:
-        print(f"[INFO] Found single video: {result.get('title')}")
-        tracks = [{
-            'id': result['id'],
-            'title': result.get('title', 'Full Album'),
-            'url': f"https://www.youtube.com/watch?v={result['id']}"
-        }]
-
-    if not tracks:
-        print("[ERROR] No valid tracks found.")
-        sys.exit(1)
-
-    print(f"[INFO] Beginning to process {len(tracks)} tracks...")
-    all_image_paths = []
-
-    for idx, track in enumerate(tracks, start=1):
-        percent = int((idx - 1) / len(tracks) * 100)
-        print(f"[PROGRESS] {percent}% complete")
-        print(f"[INFO] Processing track {idx}/{len(tracks)}: {track['title']}")
-        try:
-            if 'url' in track:
-                print(f"[DEBUG] Downloading audio for: {track['url']}")
-                audio_file, song_title, _ = youtube_utils.download_youtube_audio_and_metadata(
-                    track['url'],
-                    output_filename=os.path.join(output_folder, f"track_{idx:02d}.wav")
-                )
-            else:
-                print(f"[DEBUG] Using local file: {track['file']}")
-                audio_file = track['file']
-                song_title = track['title']
-
-            print("[DEBUG] Starting audio analysis...")
-            colors = audio_processing.process_audio(audio_file, num_segments=1000)
-            print(f"[DEBUG] Generated {len(colors)} colors")
-
-            base_gradient = visualization.create_gradient_image(colors, height=200, target_width=1000)
-            output_filename = f"{idx:02d}_{sanitize_filename(song_title)}.png"
-            full_output_path = os.path.join(output_folder, output_filename)
-
-            visualization.create_track_visualization(
-                base_gradient, song_title, full_output_path
-            )
-            all_image_paths.append(full_output_path)
-
-            print(f"[INFO] Saved visualization: {output_filename}")
-
-        except Exception as e:
-            print(f"[ERROR] Error processing track {idx}: {e}")
-
-    print("[INFO] Creating combined image...")
+    if direct_url and not user_input:
+        return JobConfig(url=direct_url, bg_color=bg_color, **options)
+
+    user_input = user_input or os.environ.get("AUDIOVISUALIZER_INPUT")
+    if not user_input:
+        user_input = input("Enter YouTube URL, album/song name, or a local folder/file: ").strip()
+    if os.path.exists(user_input):
+        return JobConfig(folder=user_input, bg_color=bg_color, **options)
+    selection_index = os.environ.get("AUDIOVISUALIZER_SELECTION_INDEX")
+    selection_index = int(selection_index) if selection_index and selection_index.isdigit() else None
+    return JobConfig(query=user_input, selection_index=selection_index, bg_color=bg_color, **options)
+
+def print_progress(done, total, title):
+    print(f"[PROGRESS] {int(done / total * 100)}% complete", flush=True)
+
+def consoleMain(workers=None, download_workers=None, queue_depth=None, metrics_jsonl=None, user_input=None,
+                **render_options):
+    """
+    Command-line front-end over pipeline.run_job, configured from arguments and
+    AUDIOVISUALIZER_* environment variables. Per-stage timings are appended to
+    `metrics_jsonl` (or $AUDIOVISUALIZER_METRICS_JSONL) as JSON lines when set, and
+    summarised at the end of the run. `render_options` are the image options of
+    render_options_from_env.
+    """
+    config = job_config_from_env(user_input, **render_options)
+    if workers is None:
+        workers = get_worker_count()
+    if download_workers is None:
+        download_workers = get_env_int("AUDIOVISUALIZER_DOWNLOAD_WORKERS", 2)
+    if queue_depth is None:
+        queue_depth = get_env_int("AUDIOVISUALIZER_QUEUE_DEPTH", 2)
+
+    recorder = metrics.Recorder()
+    metrics_jsonl = metrics_jsonl or os.environ.get("AUDIOVISUALIZER_METRICS_JSONL")
+    sink = metrics.JsonLinesSink(metrics_jsonl) if metrics_jsonl else None
+    if sink:
+        recorder.subscribe(sink)
     try:
-        combined_path = visualization.create_combined_image(
-            all_image_paths,
-            output_folder,
-            album_title,
-            bg_color
+        print("[PROGRESS] 0% complete", flush=True)
+        result = run_job(
+            config, print_progress, recorder,
+            workers=workers, download_workers=download_workers, queue_depth=queue_depth,
+            cache=analysis_cache.get_default_cache(), thumbnails=thumbnails.get_default_fetcher(),
+            media_dir=get_local_media()
         )
-        print(f"[INFO] Combined image saved to: {combined_path}")
-        print(f"[OUTPUT] {combined_path}", flush=True) 
-    except Exception as e:
-        print(f"[ERROR] Failed to create combined image: {e}")
-
+    except PipelineError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    finally:
+        if recorder.events:
+            print("[METRICS] Stage timings:\n" + recorder.format_summary())
+        if sink:
+            sink.close()
+
+    if result.combined_path:
+        print(f"[OUTPUT] {result.combined_path}", flush=True)
+    for path in result.extra_combined_paths.values():
+        print(f"[OUTPUT] {path}", flush=True)
     print("[INFO] Done!")
-    # Cleanup: remove intermediate audio files, keep only the images (lets you change the background color later)
-    try:
-        for f in os.listdir(output_folder):
-            if not f.endswith(".png"):
-                file_path = os.path.join(output_folder, f)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-        print("[CLEANUP] Removed intermediate track files.")
-    except Exception as e:
-        print(f"[CLEANUP WARNING] Could not delete some files: {e}")
-    # Remove temp audio files just in case
-    for f in os.listdir(os.getcwd()):
-        if f.startswith("temp_audio."):
-            try:
-                os.remove(f)
-            except:
-                pass
-
-
+    return result
 
 if __name__ == "__main__":
-    consoleMain()
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate audio visualizations from YouTube albums")
+    parser.add_argument("input", nargs="?", default=None,
+                        help="YouTube URL, search, or a local folder, audio file or .cue sheet "
+                             "(default: $AUDIOVISUALIZER_DIRECT_URL / $AUDIOVISUALIZER_INPUT, else prompt)")
+    parser.add_argument("--workers", type=parse_count, default=None,
+                        help="Number of tracks to process in parallel (default: $AUDIOVISUALIZER_WORKERS or 1)")
+    parser.add_argument("--download-workers", type=parse_count, default=None,
+                        help="Number of concurrent downloads/decodes (default: $AUDIOVISUALIZER_DOWNLOAD_WORKERS or 2)")
+    parser.add_argument("--queue-depth", type=parse_count, default=None,
+                        help="Decoded tracks buffered between download and analysis "
+                             "(default: $AUDIOVISUALIZER_QUEUE_DEPTH or 2)")
+    parser.add_argument("--metrics-jsonl", default=None,
+                        help="Append per-stage timing events to this JSON-lines file "
+                             "(default: $AUDIOVISUALIZER_METRICS_JSONL)")
+    parser.add_argument("--width", type=int, default=None,
+                        help="Track image width in px (default: $AUDIOVISUALIZER_WIDTH or 775)")
+    parser.add_argument("--extra-widths", type=parse_widths, default=None,
+                        help="Comma-separated widths of additional combined images rendered from the "
+                             "same analysis, e.g. 320,3840 (default: $AUDIOVISUALIZER_EXTRA_WIDTHS)")
+    parser.add_argument("--color-mode", default=None,
+                        help="peak, centroid, top_k, bands or loudness (default: $AUDIOVISUALIZER_COLOR_MODE or peak)")
+    parser.add_argument("--extra-color-modes", type=parse_list, default=None,
+                        help="Comma-separated color modes of additional combined images rendered from the "
+                             "same analysis (default: $AUDIOVISUALIZER_EXTRA_COLOR_MODES)")
+    parser.add_argument("--silence", default=None,
+                        help="How silent stretches are drawn: hold the previous color, fade to black, or trim "
+                             "leading/trailing silence (default: $AUDIOVISUALIZER_SILENCE or hold)")
+    parser.add_argument("--analysis-rate", type=int, default=None,
+                        help="Decimate audio to this rate (Hz) before analysis, e.g. 22050; faster for hi-res "
+                             "sources but loses frequencies above half the rate "
+                             "(default: $AUDIOVISUALIZER_ANALYSIS_RATE, else full rate)")
+    args = parser.parse_args()
+    consoleMain(workers=args.workers, download_workers=args.download_workers, queue_depth=args.queue_depth,
+                metrics_jsonl=args.metrics_jsonl, user_input=args.input,
+                width=args.width, extra_widths=args.extra_widths,
+                color_mode=args.color_mode, extra_color_modes=args.extra_color_modes, silence=args.silence,
+                analysis_rate=args.analysis_rate)
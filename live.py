@@ -0,0 +1,226 @@
+"""
+Live visualizer: colors audio as it plays instead of after a whole-file analysis.
+
+Audio is read incrementally from a file (decoded over an ffmpeg pipe and paced to real
+time), from another process's pipe or from stdin as raw s16le PCM. Samples go into a
+ring buffer, and at a fixed frame rate the newest `window` samples are transformed
+(a Hann-windowed STFT whose frames overlap whenever window > samples per frame) and
+mapped to a color with the same frequency -> wavelength -> RGB tables as the offline
+analysis. Each color is pushed onto a rolling strip and handed to a callback, by
+default a true-color strip redrawn in the terminal.
+
+    python live.py song.flac
+    ffmpeg -re -i song.mp3 -f s16le -ac 1 -ar 44100 - | python live.py - --rate 44100
+
+A frame that cannot be drawn on time is dropped rather than queued, so the delay
+between a sample arriving and its color being shown stays bounded. Per-frame latency
+statistics are reported at the end.
+"""
+import sys
+import time
+import argparse
+import threading
+import subprocess
+import numpy as np
+import audio_processing
+
+class RingBuffer:
+    """Fixed-size float32 sample buffer that keeps the newest `size` samples"""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = np.zeros(size, dtype=np.float32)
+        self._end = 0
+        self.total = 0  # samples written since creation
+        self._lock = threading.Lock()
+
+    def write(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)[-self.size:]
+        with self._lock:
+            first = min(len(samples), self.size - self._end)
+            self._data[self._end:self._end + first] = samples[:first]
+            self._data[:len(samples) - first] = samples[first:]
+            self._end = (self._end + len(samples)) % self.size
+            self.total += len(samples)
+
+    def latest(self):
+        """The newest `size` samples, oldest first (zeros before enough have arrived)"""
+        with self._lock:
+            return np.concatenate((self._data[self._end:], self._data[:self._end]))
+
+class LatencyStats:
+    """Per-frame compute time and end-to-end latency (newest sample arrival -> color shown)"""
+
+    def __init__(self):
+        self.compute = []
+        self.latency = []
+        self.dropped = 0
+
+    def add(self, compute_s, latency_s):
+        self.compute.append(compute_s)
+        self.latency.append(latency_s)
+
+    def summary(self):
+        def percentiles(values):
+            if not values:
+                return {'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+            values = np.asarray(values) * 1000
+            return {
+                'p50_ms': float(np.percentile(values, 50)),
+                'p95_ms': float(np.percentile(values, 95)),
+                'max_ms': float(values.max()),
+            }
+        return {
+            'frames': len(self.compute),
+            'dropped': self.dropped,
+            'compute': percentiles(self.compute),
+            'latency': percentiles(self.latency),
+        }
+
+    def format_summary(self):
+        s = self.summary()
+        return (f"{s['frames']} frames, {s['dropped']} dropped; "
+                f"compute p50 {s['compute']['p50_ms']:.2f} ms, p95 {s['compute']['p95_ms']:.2f} ms, "
+                f"max {s['compute']['max_ms']:.2f} ms; "
+                f"latency p50 {s['latency']['p50_ms']:.2f} ms, p95 {s['latency']['p95_ms']:.2f} ms, "
+                f"max {s['latency']['max_ms']:.2f} ms")
+
+class LiveVisualizer:
+    """
+    Rolling color strip for a live stream. Feed samples with `push` (any thread) and call
+    `frame` once per display frame; `run` does both for a PCM stream at `fps`. The strip
+    holds the last `width` colors, oldest first.
+    """
+
+    def __init__(self, sample_rate, fps=30, window=4096, width=200):
+        self.sample_rate = sample_rate
+        self.fps = fps
+        self.window = window
+        self.buffer = RingBuffer(window)
+        self.strip = np.zeros((width, 3), dtype=np.uint8)
+        self.stats = LatencyStats()
+        self._last_arrival = None
+        # Warm the cached Hann window and per-bin color table before the first frame
+        self._colors = audio_processing.bin_color_table(window, sample_rate)
+        audio_processing.frame_peak_bins(np.zeros((1, window), dtype=np.float32))
+
+    def push(self, samples):
+        self.buffer.write(samples)
+        self._last_arrival = time.perf_counter()
+
+    def frame(self):
+        """Color of the newest window, also appended to the strip"""
+        start = time.perf_counter()
+        bins = audio_processing.frame_peak_bins(self.buffer.latest()[np.newaxis])
+        color = self._colors[bins[0]]
+        self.strip[:-1] = self.strip[1:]
+        self.strip[-1] = color
+        done = time.perf_counter()
+        self.stats.add(done - start, done - (self._last_arrival or start))
+        return color
+
+    def run(self, stream, on_frame=None, channels=1, realtime=False):
+        """
+        Read s16le PCM from a binary `stream` on a background thread and produce one color
+        per 1/fps seconds until it ends, calling `on_frame(color, strip)` for each. With
+        `realtime=True` reading is paced to the sample rate, for sources that arrive faster
+        than they play (files). Returns the LatencyStats.
+        """
+        hop = max(1, self.sample_rate // self.fps)
+        finished = threading.Event()
+
+        def read():
+            started = time.perf_counter()
+            read_samples = 0
+            try:
+                while True:
+                    data = stream.read(hop * channels * 2)
+                    if not data:
+                        break
+                    data = data[:len(data) - len(data) % (channels * 2)]
+                    samples = np.frombuffer(data, dtype=np.int16)
+                    if channels > 1:
+                        samples = samples.reshape(-1, channels).mean(axis=1)
+                    if realtime:
+                        # A chunk is available once its last sample would have played
+                        ahead = started + (read_samples + len(samples)) / self.sample_rate - time.perf_counter()
+                        if ahead > 0:
+                            time.sleep(ahead)
+                    self.push(samples)
+                    read_samples += len(samples)
+            finally:
+                finished.set()
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        interval = 1 / self.fps
+        next_tick = time.perf_counter()
+        while not finished.is_set():
+            now = time.perf_counter()
+            if now < next_tick:
+                time.sleep(next_tick - now)
+            elif now - next_tick > interval:
+                # Too far behind: skip the missed frames rather than draw stale ones late
+                missed = int((now - next_tick) / interval)
+                self.stats.dropped += missed
+                next_tick += missed * interval
+            if self.buffer.total:
+                color = self.frame()
+                if on_frame:
+                    on_frame(color, self.strip)
+            next_tick += interval
+        reader.join()
+        return self.stats
+
+def open_source(source, sample_rate):
+    """
+    Binary PCM stream for `source`: stdin for "-", otherwise the file decoded to mono
+    s16le at `sample_rate` over an ffmpeg pipe. Returns (stream, process or None).
+    """
+    if source == '-':
+        return sys.stdin.buffer, None
+    process = subprocess.Popen(
+        ['ffmpeg', '-v', 'error', '-i', source, '-f', 's16le', '-acodec', 'pcm_s16le',
+         '-ac', '1', '-ar', str(sample_rate), 'pipe:1'],
+        stdout=subprocess.PIPE
+    )
+    return process.stdout, process
+
+def terminal_strip(color, strip, width=80):
+    """Redraw the newest `width` colors of the strip in place as true-color blocks"""
+    cells = "".join(f"\x1b[48;2;{r};{g};{b}m " for r, g, b in strip[-width:])
+    sys.stderr.write(f"\r{cells}\x1b[0m")
+    sys.stderr.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live audio color visualizer")
+    parser.add_argument("source", help="Audio file to play in real time, or - for s16le PCM on stdin")
+    parser.add_argument("--rate", type=int, default=44100, help="Sample rate to decode to, or of the stdin PCM")
+    parser.add_argument("--channels", type=int, default=1, help="Channels of the stdin PCM")
+    parser.add_argument("--fps", type=int, default=30, help="Color updates per second")
+    parser.add_argument("--window", type=int, default=4096, help="STFT window in samples")
+    parser.add_argument("--width", type=int, default=80, help="Colors kept in the strip")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Pace stdin PCM to the sample rate (files are always paced)")
+    parser.add_argument("--no-display", action="store_true", help="Only report latency statistics")
+    args = parser.parse_args(argv)
+
+    stream, process = open_source(args.source, args.rate)
+    visualizer = LiveVisualizer(args.rate, fps=args.fps, window=args.window, width=args.width)
+    on_frame = None if args.no_display else (lambda color, strip: terminal_strip(color, strip, args.width))
+    try:
+        stats = visualizer.run(stream, on_frame, channels=args.channels if process is None else 1,
+                               realtime=process is not None or args.realtime)
+    except KeyboardInterrupt:
+        stats = visualizer.stats
+    finally:
+        if process:
+            process.kill()
+            process.wait()
+    if not args.no_display:
+        sys.stderr.write("\n")
+    print(f"[INFO] Live visualizer: {stats.format_summary()}")
+    return stats
+
+if __name__ == "__main__":
+    main()
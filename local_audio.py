@@ -0,0 +1,163 @@
+import os
+import re
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import audio_processing
+import metrics
+from analysis_cache import file_digest
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.mp3', '.ogg', '.opus', '.m4a', '.aac', '.aiff', '.aif', '.wma')
+
+def read_tags(path):
+    """
+    Container and stream tags of an audio file via ffprobe, with lower-cased keys.
+    Returns {} when ffprobe is missing or cannot read the file.
+    """
+    command = [
+        'ffprobe', '-v', 'error', '-of', 'json',
+        '-show_entries', 'format_tags:stream_tags', path
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        probe = json.loads(result.stdout)
+    except Exception:
+        return {}
+    tags = {}
+    # Vorbis/Opus keep their tags on the stream, most other containers on the format
+    for stream in probe.get('streams', []):
+        tags.update({key.lower(): value for key, value in stream.get('tags', {}).items()})
+    tags.update({key.lower(): value for key, value in probe.get('format', {}).get('tags', {}).items()})
+    return tags
+
+def _tag_number(value):
+    """Leading integer of a tag such as "3/12", or None"""
+    match = re.match(r'\s*(\d+)', value or "")
+    return int(match.group(1)) if match else None
+
+def _natural_key(name):
+    """Sort key that puts "2 Song" before "10 Song\""""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+def folder_tracks(folder):
+    """
+    Album title and tracks for the audio files in `folder`. Tracks are ordered by their
+    disc and track number tags when every file has a track number, otherwise by file name;
+    titles come from the title tag, falling back to the file name.
+    """
+    files = sorted(
+        (f for f in os.listdir(folder) if f.lower().endswith(AUDIO_EXTENSIONS)),
+        key=_natural_key
+    )
+    paths = [os.path.join(folder, f) for f in files]
+    with metrics.stage('metadata'), ThreadPoolExecutor(max_workers=8) as executor:
+        tags = list(executor.map(read_tags, paths))
+
+    numbers = [_tag_number(t.get('track') or t.get('tracknumber')) for t in tags]
+    if paths and all(number is not None for number in numbers):
+        discs = [_tag_number(t.get('disc') or t.get('discnumber')) or 1 for t in tags]
+        order = sorted(range(len(paths)), key=lambda i: (discs[i], numbers[i]))
+    else:
+        order = range(len(paths))
+
+    tracks = [{
+        'title': tags[i].get('title') or os.path.splitext(files[i])[0],
+        'file': paths[i],
+    } for i in order]
+
+    albums = {t.get('album') for t in tags}
+    album_title = albums.pop() if len(albums) == 1 and None not in albums else os.path.basename(os.path.normpath(folder))
+    return album_title, tracks
+
+def _cue_value(rest):
+    rest = rest.strip()
+    if rest.startswith('"'):
+        return rest[1:rest.find('"', 1)] if '"' in rest[1:] else rest[1:]
+    return rest.split()[0] if rest else ""
+
+def parse_cue(path):
+    """
+    Album title and tracks of a cue sheet. Each track has its number, title, the audio
+    file it is in (absolute) and its start in seconds (INDEX 01, 75 frames per second).
+    """
+    for encoding in ('utf-8-sig', 'cp1252', 'latin-1'):
+        try:
+            with open(path, encoding=encoding) as f:
+                lines = f.read().splitlines()
+            break
+        except UnicodeDecodeError:
+            continue
+
+    folder = os.path.dirname(os.path.abspath(path))
+    album_title = None
+    current_file = None
+    tracks = []
+    for line in lines:
+        command, _, rest = line.strip().partition(' ')
+        command = command.upper()
+        if command == 'FILE':
+            current_file = os.path.join(folder, _cue_value(rest))
+        elif command == 'TRACK':
+            tracks.append({'number': int(rest.split()[0]), 'title': None, 'file': current_file, 'start': None})
+        elif command == 'TITLE':
+            if tracks:
+                tracks[-1]['title'] = _cue_value(rest)
+            else:
+                album_title = _cue_value(rest)
+        elif command == 'INDEX' and tracks:
+            number, timestamp = rest.split()[:2]
+            if int(number) == 1:
+                minutes, seconds, frames = (int(x) for x in timestamp.split(':'))
+                tracks[-1]['start'] = minutes * 60 + seconds + frames / 75
+
+    tracks = [t for t in tracks if t['start'] is not None and t['file']]
+    return album_title or os.path.splitext(os.path.basename(path))[0], tracks
+
+def cue_tracks(path, sample_rate=44100):
+    """
+    Album title and tracks of a cue sheet. Each referenced audio file is decoded once and
+    its tracks are zero-copy slices of it, as for chaptered videos.
+    """
+    album_title, cue = parse_cue(path)
+    files = list(dict.fromkeys(t['file'] for t in cue))
+    with ThreadPoolExecutor(max_workers=max(1, min(len(files), 4))) as executor:
+        decoded = dict(zip(files, executor.map(
+            metrics.bind(lambda f: audio_processing.decode_audio(f, sample_rate)), files
+        )))
+        # Content digests rather than paths, so an edited image is never served stale cache entries
+        digests = dict(zip(files, executor.map(file_digest, files)))
+
+    tracks = []
+    for i, track in enumerate(cue):
+        samples = decoded[track['file']]
+        next_track = cue[i + 1] if i + 1 < len(cue) else None
+        end = next_track['start'] if next_track and next_track['file'] == track['file'] else len(samples) / sample_rate
+        track_samples = samples[int(track['start'] * sample_rate):int(end * sample_rate)]
+        if len(track_samples) == 0:
+            print(f"  Error: Track {track['number']} is outside the decoded audio")
+            continue
+        tracks.append({
+            'id': f"sha256:{digests[track['file']]}:{track['start']:.3f}-{end:.3f}",
+            'title': track['title'] or f"Track {track['number']}",
+            'samples': track_samples,
+            'sample_rate': sample_rate,
+        })
+    return album_title, tracks
+
+def load_local(path, sample_rate=44100):
+    """
+    Album title and tracks for a local input: a .cue sheet, a folder holding one .cue
+    sheet, a folder of audio files, or a single audio file.
+    """
+    if os.path.isdir(path):
+        cues = [f for f in os.listdir(path) if f.lower().endswith('.cue')]
+        if len(cues) == 1:
+            path = os.path.join(path, cues[0])
+        else:
+            return folder_tracks(path)
+    if path.lower().endswith('.cue'):
+        return cue_tracks(path, sample_rate)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    title = read_tags(path).get('title') or os.path.splitext(os.path.basename(path))[0]
+    return title, [{'title': title, 'file': path}]
@@ -0,0 +1,144 @@
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# The recorder and labels for the current job. Context variables rather than globals so
+# concurrent jobs (and their worker threads, via `bind`) each report to their own recorder.
+_current_recorder = contextvars.ContextVar('audiovisualizer_recorder', default=None)
+_current_labels = contextvars.ContextVar('audiovisualizer_labels', default={})
+
+class Recorder:
+    """
+    Collects structured stage events and forwards each one to the registered callbacks.
+    An event is a dict with at least `stage`, `duration_s` and `ts` (start, epoch seconds),
+    plus any labels (e.g. `track`) and counters (e.g. `bytes`, `samples`) the stage reports.
+    """
+
+    def __init__(self, callbacks=()):
+        self.events = []
+        self.callbacks = list(callbacks)
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def emit(self, event):
+        with self._lock:
+            self.events.append(event)
+            for callback in self.callbacks:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"[WARN] Metrics callback failed: {e}")
+
+    def summary(self):
+        """Per-stage totals in first-seen order: count, total/mean/max seconds, bytes and samples"""
+        rows = {}
+        with self._lock:
+            for event in self.events:
+                row = rows.setdefault(event['stage'], {
+                    'stage': event['stage'], 'count': 0, 'total_s': 0.0, 'max_s': 0.0,
+                    'bytes': 0, 'samples': 0, 'errors': 0,
+                })
+                row['count'] += 1
+                row['total_s'] += event['duration_s']
+                row['max_s'] = max(row['max_s'], event['duration_s'])
+                row['bytes'] += event.get('bytes', 0)
+                row['samples'] += event.get('samples', 0)
+                row['errors'] += 'error' in event
+        for row in rows.values():
+            row['mean_s'] = row['total_s'] / row['count']
+        return list(rows.values())
+
+    def format_summary(self):
+        """Summary as a fixed-width text table"""
+        lines = [f"{'stage':<14}{'count':>6}{'total s':>10}{'mean s':>10}{'max s':>10}{'MiB':>10}{'samples':>14}"]
+        for row in self.summary():
+            lines.append(
+                f"{row['stage']:<14}{row['count']:>6}{row['total_s']:>10.3f}{row['mean_s']:>10.3f}"
+                f"{row['max_s']:>10.3f}{row['bytes'] / 2**20:>10.1f}{row['samples']:>14}"
+                + (f"  ({row['errors']} failed)" if row['errors'] else "")
+            )
+        return "\n".join(lines)
+
+class JsonLinesSink:
+    """Recorder callback that appends each event as one JSON line to `path`"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self._file.write(json.dumps(event, default=str) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+@contextmanager
+def recording(recorder):
+    """Send events from this context (and anything it `bind`s) to `recorder`"""
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+@contextmanager
+def labels(**new_labels):
+    """Attach labels such as track=3 to every event recorded in this context"""
+    token = _current_labels.set({**_current_labels.get(), **new_labels})
+    try:
+        yield
+    finally:
+        _current_labels.reset(token)
+
+def bind(fn):
+    """Wrap `fn` so it records to the current recorder and labels when run on another thread"""
+    recorder = _current_recorder.get()
+    bound_labels = _current_labels.get()
+
+    def wrapper(*args, **kwargs):
+        with recording(recorder), labels(**bound_labels):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def record(stage_name, duration_s, **fields):
+    """Emit one stage event to the current recorder; a no-op when nothing is recording"""
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return
+    recorder.emit({
+        'stage': stage_name,
+        'ts': time.time() - duration_s,
+        'duration_s': duration_s,
+        **_current_labels.get(),
+        **fields,
+    })
+
+def replay(events):
+    """Re-emit events collected elsewhere (e.g. in a worker process) to the current recorder"""
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        for event in events:
+            recorder.emit(event)
+
+@contextmanager
+def stage(stage_name, **fields):
+    """
+    Time a block as one stage event. The yielded dict can be updated inside the block
+    with counters known only afterwards, e.g. info['bytes'] = len(data).
+    """
+    info = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield info
+    except BaseException as e:
+        info['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record(stage_name, time.perf_counter() - start, **info)
@@ -0,0 +1,592 @@
+"""
+Re-entrant album pipeline.
+
+Everything a job needs is passed in explicitly: no environment variables are read, no
+`sys.exit` is called and results are returned rather than printed, so several jobs can
+run concurrently in one process:
+
+    with Pipeline(workers=4, cache=analysis_cache.get_default_cache()) as pipeline:
+        result = pipeline.run(JobConfig(url="https://www.youtube.com/playlist?list=..."))
+        print(result.combined_path)
+
+or, for a one-off job, `run_job(JobConfig(query="artist album"))`. consoleMain.py and
+RUNME.py are thin front-ends over this module.
+"""
+import os
+import queue
+import contextlib
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import audio_processing
+import visualization
+import youtube_utils
+import local_audio
+import metrics
+from analysis_cache import file_digest
+from config import sanitize_filename
+from thumbnails import ThumbnailFetcher
+
+# Rate compressed and downloaded audio is decoded at unless a job sets `analysis_rate`
+ANALYSIS_SAMPLE_RATE = 44100
+# Everything that affects a track's spectral summary; part of the analysis cache key.
+# The output width and color mode are applied to the cached summary, so they are not
+ANALYSIS_PARAMS = {
+    'summary': list(audio_processing.SUMMARY_FIELDS),
+    'bands': list(audio_processing.BAND_EDGES_HZ),
+    'top_k': audio_processing.TOP_K,
+    'top_k_of': 'local_maxima',
+    'silence_db': audio_processing.SILENCE_THRESHOLD_DB,
+    'frame_length': audio_processing.SUMMARY_FRAME_LENGTH,
+    'hop': audio_processing.SUMMARY_HOP,
+    'window': 'hann',
+    'sample_rate': ANALYSIS_SAMPLE_RATE,
+}
+
+def track_cache_key(cache, track, analysis_rate=None):
+    """Analysis cache key for a track: its video id, or a content digest for local files"""
+    if cache is None:
+        return None
+    params = dict(ANALYSIS_PARAMS, sample_rate=analysis_rate or ANALYSIS_SAMPLE_RATE)
+    if 'file' in track:
+        decoder = 'wav' if track['file'].lower().endswith('.wav') else 'ffmpeg'
+        if decoder == 'wav':
+            params['sample_rate'] = analysis_rate or 'native'
+        return cache.key(f"sha256:{file_digest(track['file'])}", **params, decoder=decoder)
+    return cache.key(track['id'], **params)
+
+def fetch_track(idx, track, output_folder, cache=None, analysis_rate=None, media_dir=None):
+    """
+    Download one track (I/O-bound stage). Downloads and compressed local files are passed
+    on as files to decode, which the analysis stage streams through an ffmpeg pipe so only
+    a block of samples is held at a time; the download is deleted once analysed.
+    Already-decoded chapter slices and local WAVs are passed on as they are. On an analysis
+    cache hit nothing is downloaded and the cached spectral summary is passed on instead.
+    URL tracks come from YouTube, or from youtube_utils.LocalYoutubeDL serving `media_dir`.
+
+    With an `analysis_rate`, ffmpeg decodes at that rate (its resampler filters out what
+    the lower rate cannot hold) and WAV files above it are memory-mapped and decimated
+    block-wise by audio_processing.downsample. Chapter and cue slices are decoded at the
+    analysis rate to begin with.
+    """
+    cache_key = track_cache_key(cache, track, analysis_rate)
+    if cache_key:
+        summary = cache.get(cache_key)
+        if summary is not None:
+            print(f"[INFO] Analysis cache hit for track {idx}: {track['title']}")
+            return {'idx': idx, 'title': track['title'], 'summary': summary}
+
+    item = _fetch_audio(idx, track, output_folder, analysis_rate, media_dir)
+    item.setdefault('analysis_rate', analysis_rate)
+    if cache_key:
+        item['cache'] = cache
+        item['cache_key'] = cache_key
+    return item
+
+def _fetch_audio(idx, track, output_folder, analysis_rate=None, media_dir=None):
+    decode_rate = analysis_rate or ANALYSIS_SAMPLE_RATE
+    if 'samples' in track:
+        return {'idx': idx, 'title': track['title'], 'samples': track['samples'], 'sample_rate': track['sample_rate']}
+
+    if 'url' in track:
+        print(f"[DEBUG] Downloading audio for: {track['url']}")
+        audio_file, song_title, _ = youtube_utils.download_youtube_audio_and_metadata(
+            track['url'],
+            output_filename=os.path.join(output_folder, f"track_{idx:02d}.wav"),
+            transcode=False,
+            media_dir=media_dir
+        )
+        item = {'idx': idx, 'title': song_title, 'file': audio_file, 'remove': True}
+        if audio_file.lower().endswith('.wav'):
+            # Read like a local WAV, held to the rate other downloads are decoded at
+            item['analysis_rate'] = decode_rate
+        else:
+            item['decode_rate'] = decode_rate
+        return item
+
+    if not track['file'].lower().endswith('.wav'):
+        # Compressed local files are streamed through ffmpeg by the analysis stage
+        return {'idx': idx, 'title': track['title'], 'file': track['file'], 'decode_rate': decode_rate}
+
+    print(f"[DEBUG] Using local file: {track['file']}")
+    return {'idx': idx, 'title': track['title'], 'file': track['file']}
+
+def render_track(item, output_folder, variants=(('peak', visualization.TRACK_WIDTH),), silence='hold'):
+    """
+    Analyse one fetched track and render it for each (color mode, width) of `variants`,
+    drawing silence by the `silence` policy (CPU-bound stage). Returns the path the first
+    image should be saved to, the list of images (both None on failure) and the metrics
+    events recorded meanwhile, so a worker process can hand them back to the parent;
+    writing the PNG is left to the caller.
+    """
+    recorder = metrics.Recorder()
+    with metrics.recording(recorder), metrics.labels(track=item['idx']):
+        rendered = _render_track(item, output_folder, variants, silence)
+    path, images = rendered or (None, None)
+    return path, images, recorder.events
+
+def _render_track(item, output_folder, variants, silence):
+    idx = item['idx']
+    try:
+        if 'summary' in item:
+            summary = item['summary']
+        else:
+            print("[DEBUG] Starting audio analysis...")
+            if 'samples' in item:
+                samples, sample_rate = audio_processing.downsample(
+                    item['samples'], item['sample_rate'], item.get('analysis_rate')
+                )
+                summary = audio_processing.spectral_summary(samples, sample_rate)
+            else:
+                try:
+                    if 'decode_rate' in item:
+                        print(f"[DEBUG] Decoding via ffmpeg pipe: {item['file']}")
+                        summary = audio_processing.summarize_decoded(item['file'], item['decode_rate'])
+                    else:
+                        # WAVs are memory-mapped, and decimated block-wise when above the analysis rate
+                        summary = audio_processing.summarize_audio(item['file'], analysis_rate=item.get('analysis_rate'))
+                finally:
+                    if item.get('remove'):
+                        os.remove(item['file'])
+            print(f"[DEBUG] Summarised {len(summary)} frames")
+
+            if 'cache' in item:
+                item['cache'].put(item['cache_key'], summary)
+
+        song_title = item['title']
+        output_filename = f"{idx:02d}_{sanitize_filename(song_title)}.png"
+        full_output_path = os.path.join(output_folder, output_filename)
+
+        # Every mode and size is pooled from the same summary: no re-decode or re-FFT per variant
+        images = []
+        for mode, width in variants:
+            colors = audio_processing.summary_colors(summary, width, mode, silence)
+            _, height = visualization.track_size(width)
+            gradient = visualization.create_gradient_image(colors, height=height, target_width=width)
+            images.append(visualization.render_track_image(gradient, song_title, width))
+        return full_output_path, images
+
+    except Exception as e:
+        print(f"[ERROR] Error processing track {idx}: {e}")
+        return None
+
+def save_track_image(image, path):
+    """Write one rendered track image to disk"""
+    try:
+        with metrics.stage('write'):
+            image.save(path)
+        print(f"[INFO] Saved visualization: {os.path.basename(path)}")
+    except Exception as e:
+        print(f"[ERROR] Could not save {path}: {e}")
+
+def start_worker_pool(workers):
+    """Process pool for track analysis"""
+    # Spawned rather than forked workers: forking while downloader threads are starting
+    # ffmpeg subprocesses can leak their pipes into the worker and hang the download
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+def process_tracks(tracks, output_folder, workers=1, download_workers=2, queue_depth=2, cache=None,
+                   png_writer=None, pool=None, progress=None, variants=(('peak', visualization.TRACK_WIDTH),),
+                   silence='hold', analysis_rate=None, media_dir=None):
+    """
+    Producer/consumer track pipeline. A pool of `download_workers` threads downloads and
+    decodes tracks into a queue holding at most `queue_depth` tracks, while `workers`
+    consumers analyse and render them (in a process pool when `workers` > 1), so track
+    N+1 downloads while track N is analysed. At most queue_depth + download_workers + workers
+    fetched tracks are held at once; downloads wait in the queue as files and are decoded
+    a block at a time during analysis. Tracks found in the analysis `cache` skip download
+    and analysis, and the rest are analysed at `analysis_rate` (see fetch_track, which
+    also takes `media_dir`).
+
+    Returns (path, images) pairs in track order, with one image per (color mode, width) of
+    `variants` and silence drawn by the `silence` policy. The first image is saved to its
+    path as soon as it is rendered, on the `png_writer` executor when one is given so the
+    writes stay off the critical path. A process `pool` shared across jobs may be passed
+    in instead of starting one per call, and `progress(done, total, title)` is called as
+    each track finishes.
+    """
+    check_worker_counts(workers, download_workers, queue_depth)
+    total = len(tracks)
+    track_queue = queue.Queue(maxsize=queue_depth)
+    producer_error = []
+    results = {}
+    results_lock = threading.Lock()
+
+    print(f"[INFO] Processing tracks with {download_workers} download and {workers} analysis workers")
+
+    def download(idx, track):
+        try:
+            with metrics.labels(track=idx):
+                item = fetch_track(idx, track, output_folder, cache, analysis_rate, media_dir)
+        except Exception as e:
+            print(f"[ERROR] Error downloading track {idx}: {e}")
+            item = {'idx': idx, 'title': track['title'], 'error': e}
+        track_queue.put(item)
+
+    def produce():
+        try:
+            with ThreadPoolExecutor(max_workers=download_workers) as downloaders:
+                for idx, track in enumerate(tracks, start=1):
+                    downloaders.submit(metrics.bind(download), idx, track)
+        except BaseException as e:
+            producer_error.append(e)
+        finally:
+            # Always release the consumers, or they would wait on the queue forever
+            for _ in range(workers):
+                track_queue.put(None)
+
+    def consume(pool):
+        while True:
+            item = track_queue.get()
+            if item is None:
+                return
+            idx = item['idx']
+            rendered = None
+            if 'error' not in item:
+                print(f"[INFO] Processing track {idx}/{total}: {item['title']}")
+                try:
+                    if pool:
+                        path, images, events = pool.submit(render_track, item, output_folder, variants, silence).result()
+                    else:
+                        path, images, events = render_track(item, output_folder, variants, silence)
+                    metrics.replay(events)
+                    if images is not None:
+                        rendered = (path, images)
+                except Exception as e:
+                    print(f"[ERROR] Error processing track {idx}: {e}")
+            if rendered:
+                with metrics.labels(track=idx):
+                    if png_writer:
+                        png_writer.submit(metrics.bind(save_track_image), images[0], path)
+                    else:
+                        save_track_image(images[0], path)
+            with results_lock:
+                results[idx] = rendered
+                done = len(results)
+            if progress:
+                progress(done, total, item['title'])
+
+    own_pool = pool is None and workers > 1
+    if own_pool:
+        pool = start_worker_pool(workers)
+    try:
+        producer = threading.Thread(target=metrics.bind(produce), daemon=True)
+        producer.start()
+        # The main thread is one of the consumers so single-worker rendering stays on it
+        consumers = [threading.Thread(target=metrics.bind(consume), args=(pool,), daemon=True) for _ in range(workers - 1)]
+        for consumer in consumers:
+            consumer.start()
+        consume(pool)
+        for consumer in consumers:
+            consumer.join()
+        producer.join()
+    finally:
+        if own_pool:
+            pool.shutdown()
+    if producer_error:
+        raise producer_error[0]
+
+    return [results[idx] for idx in sorted(results) if results[idx]]
+
+def check_worker_counts(workers, download_workers, queue_depth):
+    """Raise ValueError unless every worker count and the queue depth is at least 1"""
+    for name, value in (('workers', workers), ('download_workers', download_workers), ('queue_depth', queue_depth)):
+        if value < 1:
+            raise ValueError(f"{name} must be at least 1, got {value}")
+
+class PipelineError(Exception):
+    """A job could not produce an album image (nothing found, no usable tracks)"""
+
+class JobConfig:
+    """
+    One album job. Give `url` (a playlist or chaptered video), a search `query` with an
+    optional `selection_index` into its results, or a local `folder`: a folder of audio
+    files, a .cue sheet (or a folder holding one) or a single audio file. `bg_color` is an (r, g, b)
+    tuple, or None to pick one from the album cover. Output goes to a folder named after
+    the album inside `output_dir` (default: the current directory), with a
+    `_visualization` suffix when that would be the local source folder itself.
+
+    Track images are `width` px wide (default visualization.TRACK_WIDTH) and colored by
+    `color_mode` (one of audio_processing.COLOR_MODES). Each of `extra_widths` and
+    `extra_color_modes` adds combined images in that size or mode, e.g. a thumbnail, a
+    poster or a band-energy version, rendered from the same analysis. Silent stretches are
+    drawn by the `silence` policy (one of audio_processing.SILENCE_POLICIES): 'hold' the
+    previous color, 'fade' it to black, or 'trim' leading and trailing silence.
+
+    `analysis_rate` (Hz) decimates audio before analysis: less FFT work and memory for
+    hi-res sources, at the cost of frequencies above half the rate. None analyses WAV
+    files at their own rate and decodes everything else at ANALYSIS_SAMPLE_RATE.
+    """
+
+    def __init__(self, query=None, url=None, selection_index=None, bg_color=None, output_dir=None,
+                 keep_audio=False, folder=None, width=None, extra_widths=(), color_mode='peak',
+                 extra_color_modes=(), silence='hold', analysis_rate=None):
+        if not query and not url and not folder:
+            raise ValueError("JobConfig needs a query, a url or a folder")
+        self.query = query
+        self.url = url
+        self.folder = folder
+        self.selection_index = selection_index
+        self.bg_color = tuple(bg_color) if bg_color else None
+        self.output_dir = output_dir
+        self.keep_audio = keep_audio
+        self.width = width or visualization.TRACK_WIDTH
+        self.extra_widths = tuple(w for w in dict.fromkeys(extra_widths) if w != self.width)
+        if min((self.width,) + self.extra_widths) <= 0:
+            raise ValueError("Image widths must be positive")
+        self.color_mode = color_mode
+        self.extra_color_modes = tuple(m for m in dict.fromkeys(extra_color_modes) if m != color_mode)
+        for mode in (color_mode,) + self.extra_color_modes:
+            if mode not in audio_processing.COLOR_MODES:
+                raise ValueError(f"Unknown color mode {mode!r}; expected one of {', '.join(audio_processing.COLOR_MODES)}")
+        if silence not in audio_processing.SILENCE_POLICIES:
+            raise ValueError(f"Unknown silence policy {silence!r}; expected one of {', '.join(audio_processing.SILENCE_POLICIES)}")
+        self.silence = silence
+        if analysis_rate is not None and analysis_rate <= 0:
+            raise ValueError("The analysis rate must be positive")
+        self.analysis_rate = analysis_rate
+
+    @property
+    def variants(self):
+        """Every (color mode, width) to render, the main one first"""
+        widths = (self.width,) + self.extra_widths
+        return [(mode, width) for mode in (self.color_mode,) + self.extra_color_modes for width in widths]
+
+class JobResult:
+    """
+    What a finished job produced; images are the in-memory PIL renders. `extra_combined_paths`
+    maps each extra (color mode, width) of the job to its combined image.
+    """
+
+    def __init__(self, album_title, output_folder, combined_path, combined_image, track_paths,
+                 track_images, bg_color, recorder, extra_combined_paths=None):
+        self.album_title = album_title
+        self.output_folder = output_folder
+        self.combined_path = combined_path
+        self.combined_image = combined_image
+        self.track_paths = track_paths
+        self.track_images = track_images
+        self.bg_color = bg_color
+        self.metrics = recorder
+        self.extra_combined_paths = extra_combined_paths or {}
+
+class Pipeline:
+    """
+    Runs album jobs with shared settings and warm state: the analysis cache, the
+    `thumbnails` fetcher (its HTTP connections and cover cache; an in-memory
+    thumbnails.ThumbnailFetcher by default) and, when `workers` > 1, one process pool
+    reused by every job instead of being started per album. `run` is safe to call from
+    several threads at once; concurrent jobs that would write to the same output folder
+    (e.g. two albums with the same title) get numbered folders, `<title>_2` and so on,
+    so one job's cleanup never deletes another's downloads.
+
+    With a `media_dir`, searches, URLs and downloads are served from that folder by
+    youtube_utils.LocalYoutubeDL instead of YouTube (for tests and offline benchmarks).
+    """
+
+    def __init__(self, workers=1, download_workers=2, queue_depth=2, cache=None, thumbnails=None, media_dir=None):
+        check_worker_counts(workers, download_workers, queue_depth)
+        self.workers = workers
+        self.download_workers = download_workers
+        self.queue_depth = queue_depth
+        self.cache = cache
+        self.thumbnails = thumbnails or ThumbnailFetcher(cache_dir=None)
+        self.media_dir = media_dir
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._active_folders = set()
+        self._folders_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool:
+                self._pool.shutdown()
+                self._pool = None
+        self.thumbnails.close()
+
+    def _get_pool(self):
+        if self.workers <= 1:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = start_worker_pool(self.workers)
+            return self._pool
+
+    def run(self, config, progress=None, recorder=None):
+        """
+        Run one job and return a JobResult. `progress(done, total, title)` is called as each
+        track finishes; stage timings go to `recorder` (a new metrics.Recorder by default),
+        which is returned as `result.metrics`. Raises PipelineError when nothing usable
+        was found.
+        """
+        recorder = recorder or metrics.Recorder()
+        with metrics.recording(recorder), metrics.stage('total'), contextlib.ExitStack() as claims:
+            return self._run(config, progress, recorder, claims)
+
+    def _run(self, config, progress, recorder, claims):
+        if config.folder:
+            if not os.path.exists(config.folder):
+                raise PipelineError(f"No such file or folder: {config.folder}")
+            print(f"[INFO] Loading local audio: {config.folder}")
+            album_title, tracks = local_audio.load_local(config.folder, config.analysis_rate or ANALYSIS_SAMPLE_RATE)
+            source_folder = config.folder
+            if not os.path.isdir(source_folder):
+                source_folder = os.path.dirname(os.path.abspath(source_folder))
+            output_folder = self._output_folder(config, album_title, claims, source_folder)
+            return self._run_tracks(config, progress, recorder, album_title, config.bg_color, tracks, output_folder)
+
+        if config.url:
+            print(f"[INFO] Loading direct URL: {config.url}")
+            result = youtube_utils.load_youtube_url(config.url, self.media_dir)
+            user_input = config.url
+        else:
+            user_input = config.query
+            print(f"[INFO] Searching for '{user_input}'...")
+            result = youtube_utils.search_youtube_playlist(
+                user_input, selection_index=config.selection_index, media_dir=self.media_dir
+            )
+
+        if not result:
+            raise PipelineError("No results found. Please try a different search (Likely copyright error, can usually get around this by using a URL instead).")
+
+        album_title = result.get('title', user_input)
+        output_folder = self._output_folder(config, album_title, claims)
+
+        bg_color = config.bg_color
+        if bg_color:
+            print(f"[INFO] Custom background color: RGB{bg_color}")
+        else:
+            # The album cover is only needed to pick a color when none was given. It is
+            # fetched in the background while the tracks download and analyse
+            video_id = result.get('id') or (result['entries'][0].get('id') if 'entries' in result else None)
+            if video_id:
+                cover_fetch = ThreadPoolExecutor(max_workers=1)
+                bg_color = cover_fetch.submit(metrics.bind(self.thumbnails.cover_color), video_id)
+                cover_fetch.shutdown(wait=False)
+
+        if 'entries' in result:
+            print(f"[INFO] Found playlist: {result.get('title')} with {len(result['entries'])} tracks")
+            tracks = youtube_utils.extract_tracks_from_playlist(result)
+        elif 'chapters' in result:
+            print(f"[INFO] Found chaptered video: {result.get('title')}")
+            tracks = youtube_utils.split_album_video(
+                result, output_folder, sample_rate=config.analysis_rate or ANALYSIS_SAMPLE_RATE,
+                media_dir=self.media_dir
+            )
+        else:
+            print(f"[INFO] Found single video: {result.get('title')}")
+            tracks = [{
+                'id': result['id'],
+                'title': result.get('title', 'Full Album'),
+                'url': f"https://www.youtube.com/watch?v={result['id']}"
+            }]
+
+        return self._run_tracks(config, progress, recorder, album_title, bg_color, tracks, output_folder)
+
+    def _output_folder(self, config, album_title, claims, source_folder=None):
+        """Claim the job's output folder until `claims` is closed, numbering it when a running job holds it"""
+        base = os.path.join(config.output_dir or os.getcwd(), sanitize_filename(album_title))
+        if source_folder and os.path.realpath(base) == os.path.realpath(source_folder):
+            # e.g. `consoleMain.py MyAlbum` run next to the MyAlbum folder: never mix images into the music
+            base += "_visualization"
+        with self._folders_lock:
+            output_folder, number = base, 1
+            while os.path.realpath(output_folder) in self._active_folders:
+                number += 1
+                output_folder = f"{base}_{number}"
+            self._active_folders.add(os.path.realpath(output_folder))
+        claims.callback(self._release_output_folder, output_folder)
+        os.makedirs(output_folder, exist_ok=True)
+        print(f"[INFO] Saving to folder: {output_folder}")
+        return output_folder
+
+    def _release_output_folder(self, output_folder):
+        with self._folders_lock:
+            self._active_folders.discard(os.path.realpath(output_folder))
+
+    def _run_tracks(self, config, progress, recorder, album_title, bg_color, tracks, output_folder):
+        if not tracks:
+            raise PipelineError("No valid tracks found.")
+
+        print(f"[INFO] Beginning to process {len(tracks)} tracks...")
+        combined_path = None
+        combined_image = None
+        extra_combined_paths = {}
+        # Track PNGs are written in the background; the combined image is built from the
+        # in-memory renders and the writer is drained before cleanup
+        with ThreadPoolExecutor(max_workers=1) as png_writer:
+            rendered_tracks = process_tracks(
+                tracks, output_folder, self.workers, self.download_workers, self.queue_depth,
+                self.cache, png_writer, self._get_pool(), progress, config.variants, config.silence,
+                config.analysis_rate, self.media_dir
+            )
+
+            if isinstance(bg_color, Future):
+                bg_color = bg_color.result()
+            if bg_color is None and rendered_tracks:
+                # Picked once from the main variant so every size and mode shares one background
+                bg_color = visualization.get_dominant_color([images[0] for _, images in rendered_tracks])
+            for position, (mode, width) in enumerate(config.variants):
+                main = position == 0
+                print("[INFO] Creating combined image..." if main
+                      else f"[INFO] Creating {mode} {width}px combined image...")
+                try:
+                    # Margins and border keep their proportions at every width
+                    scale = width / visualization.TRACK_WIDTH
+                    image = visualization.stack_images_with_margin(
+                        [images[position] for _, images in rendered_tracks],
+                        margin=max(1, round(5 * scale)),
+                        border=max(1, round(30 * scale)),
+                        bg_color=bg_color,
+                        album_title=album_title
+                    )
+                    path = visualization.combined_image_path(
+                        output_folder, album_title,
+                        width=None if width == config.width else width,
+                        mode=None if mode == config.color_mode else mode
+                    )
+                    image.save(path)
+                    print(f"[INFO] Combined image saved to: {path}")
+                except Exception as e:
+                    print(f"[ERROR] Failed to create combined image: {e}")
+                    continue
+                if main:
+                    combined_path, combined_image = path, image
+                else:
+                    extra_combined_paths[(mode, width)] = path
+
+        # Local tracks leave no intermediate audio, and their output folder may hold other
+        # files of the user's
+        if not config.keep_audio and not config.folder:
+            with metrics.stage('cleanup'):
+                cleanup_output_folder(output_folder)
+
+        return JobResult(
+            album_title, output_folder, combined_path, combined_image,
+            [path for path, _ in rendered_tracks], [images[0] for _, images in rendered_tracks],
+            bg_color, recorder, extra_combined_paths
+        )
+
+def run_job(config, progress=None, recorder=None, **pipeline_options):
+    """Run a single job on a throwaway Pipeline; see Pipeline.run"""
+    with Pipeline(**pipeline_options) as pipeline:
+        return pipeline.run(config, progress, recorder)
+
+def cleanup_output_folder(output_folder):
+    """Remove intermediate audio files, keeping only the images (lets you change the background color later)"""
+    try:
+        for f in os.listdir(output_folder):
+            if not f.endswith(".png"):
+                file_path = os.path.join(output_folder, f)
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
+        print("[CLEANUP] Removed intermediate track files.")
+    except Exception as e:
+        print(f"[CLEANUP WARNING] Could not delete some files: {e}")
@@ -0,0 +1,26 @@
+import numpy as np
+from scipy.io import wavfile
+
+import audio_processing
+
+SAMPLE_RATE = 22050
+
+def test_process_audio_colors_equal_segments(tmp_path):
+    # One second at 440 Hz, one of silence, one at 1760 Hz
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    tone = lambda freq: 0.5 * np.sin(2 * np.pi * freq * t)
+    samples = np.concatenate([tone(440), np.zeros(SAMPLE_RATE), tone(1760)])
+    path = str(tmp_path / "tones.wav")
+    wavfile.write(path, SAMPLE_RATE, (samples * 32767).astype(np.int16))
+
+    colors = audio_processing.process_audio(path, num_segments=30)
+
+    assert colors.shape == (30, 3) and colors.dtype == np.uint8
+    low, high = (np.array(audio_processing.map_frequency_to_rgb(freq)) for freq in (440, 1760))
+    assert np.abs(colors[5].astype(int) - low).max() <= 8
+    # The silent second holds the color before it
+    assert np.abs(colors[15].astype(int) - low).max() <= 8
+    assert np.abs(colors[25].astype(int) - high).max() <= 8
+
+def test_process_audio_returns_none_on_failure(tmp_path):
+    assert audio_processing.process_audio(str(tmp_path / "missing.wav")) is None
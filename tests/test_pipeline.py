@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+import audio_processing
+import pipeline
+import youtube_utils
+
+TONES_HZ = (220, 440, 880, 1760, 3520)
+SAMPLE_RATE = 22050
+
+@pytest.fixture
+def media_dir(tmp_path):
+    """A LocalYoutubeDL folder of one-second tones, "Song 1" (220 Hz) to "Song 5" (3520 Hz)"""
+    media = tmp_path / "media"
+    media.mkdir()
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    for number, freq in enumerate(TONES_HZ, start=1):
+        samples = (0.5 * np.sin(2 * np.pi * freq * t) * 32767).astype(np.int16)
+        wavfile.write(str(media / f"Song {number}.wav"), SAMPLE_RATE, samples)
+    return str(media)
+
+@pytest.fixture
+def output_folder(tmp_path):
+    folder = tmp_path / "out"
+    folder.mkdir()
+    return str(folder)
+
+def playlist_tracks(media_dir):
+    info = youtube_utils.load_youtube_url("https://www.youtube.com/playlist?list=Album", media_dir)
+    return youtube_utils.extract_tracks_from_playlist(info)
+
+def test_process_tracks_keeps_track_order(media_dir, output_folder, monkeypatch):
+    download = youtube_utils.download_youtube_audio_and_metadata
+
+    def first_track_last(url, *args, **kwargs):
+        # Let later tracks overtake the first so results arrive out of order
+        if url.endswith("Song 1"):
+            time.sleep(0.3)
+        return download(url, *args, **kwargs)
+
+    monkeypatch.setattr(youtube_utils, 'download_youtube_audio_and_metadata', first_track_last)
+    results = pipeline.process_tracks(playlist_tracks(media_dir), output_folder, download_workers=3,
+                                      media_dir=media_dir)
+
+    names = [f"{number:02d}_Song {number}.png" for number in range(1, len(TONES_HZ) + 1)]
+    assert [os.path.basename(path) for path, _ in results] == names
+    # Track images are written and the downloads are deleted once analysed
+    assert sorted(os.listdir(output_folder)) == names
+
+    for (_, images), freq in zip(results, TONES_HZ):
+        width, height = images[0].size
+        pixel = np.array(images[0].getpixel((width // 2, 2)))
+        expected = np.array(audio_processing.map_frequency_to_rgb(freq))
+        assert np.abs(pixel - expected).max() <= 8
+
+def test_process_tracks_bounds_fetched_tracks(media_dir, output_folder, monkeypatch):
+    fetch_track, render_track = pipeline.fetch_track, pipeline.render_track
+    lock = threading.Lock()
+    held = peak = 0
+
+    def counting_fetch(*args, **kwargs):
+        nonlocal held, peak
+        item = fetch_track(*args, **kwargs)
+        with lock:
+            held += 1
+            peak = max(peak, held)
+        return item
+
+    def slow_render(*args, **kwargs):
+        nonlocal held
+        time.sleep(0.1)
+        rendered = render_track(*args, **kwargs)
+        with lock:
+            held -= 1
+        return rendered
+
+    monkeypatch.setattr(pipeline, 'fetch_track', counting_fetch)
+    monkeypatch.setattr(pipeline, 'render_track', slow_render)
+    queue_depth, download_workers, workers = 1, 2, 1
+    results = pipeline.process_tracks(playlist_tracks(media_dir), output_folder, workers=workers,
+                                      download_workers=download_workers, queue_depth=queue_depth,
+                                      media_dir=media_dir)
+
+    assert len(results) == len(TONES_HZ)
+    assert peak <= queue_depth + download_workers + workers
+
+@pytest.mark.parametrize("counts", [
+    {'workers': 0}, {'download_workers': 0}, {'queue_depth': 0},
+])
+def test_process_tracks_rejects_zero_workers(media_dir, output_folder, counts):
+    with pytest.raises(ValueError):
+        pipeline.process_tracks(playlist_tracks(media_dir), output_folder, media_dir=media_dir, **counts)
+    with pytest.raises(ValueError):
+        pipeline.Pipeline(**counts)
+
+def test_process_tracks_reraises_producer_error(media_dir, output_folder, monkeypatch):
+    def broken_executor(*args, **kwargs):
+        raise RuntimeError("no downloaders")
+
+    monkeypatch.setattr(pipeline, 'ThreadPoolExecutor', broken_executor)
+    # The consumers are still released, so this fails instead of hanging
+    with pytest.raises(RuntimeError, match="no downloaders"):
+        pipeline.process_tracks(playlist_tracks(media_dir), output_folder, workers=2, media_dir=media_dir)
+
+def test_concurrent_runs_get_their_own_output_folder(media_dir, tmp_path, monkeypatch):
+    process_tracks = pipeline.process_tracks
+    both_started = threading.Barrier(2, timeout=10)
+
+    def overlapping_process_tracks(*args, **kwargs):
+        # Hold each job until the other has claimed its folder too
+        both_started.wait()
+        return process_tracks(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'process_tracks', overlapping_process_tracks)
+    config = pipeline.JobConfig(url="https://www.youtube.com/playlist?list=Album", bg_color=(0, 0, 0),
+                                output_dir=str(tmp_path / "out"))
+    with pipeline.Pipeline(media_dir=media_dir) as runner:
+        threads = [threading.Thread(target=lambda: results.append(runner.run(config))) for _ in range(2)]
+        results = []
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Once both have finished the title's folder is free again
+        monkeypatch.setattr(pipeline, 'process_tracks', process_tracks)
+        later = runner.run(config)
+
+    folders = sorted(os.path.basename(result.output_folder) for result in results)
+    assert len(folders) == 2 and folders[1] == folders[0] + "_2"
+    assert all(os.path.exists(result.combined_path) for result in results)
+    assert later.output_folder == min(result.output_folder for result in results)
@@ -0,0 +1,80 @@
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from thumbnails import ThumbnailFetcher
+
+COVER_COLOR = (200, 40, 40)
+
+class CoverHandler(BaseHTTPRequestHandler):
+    """Serves the server's `covers` (path -> bytes) and 404s anything else, logging each path"""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        content = self.server.covers.get(self.path)
+        if content is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def cover_server():
+    """Local stand-in for img.youtube.com with an hqdefault (but no maxresdefault) cover for "abc" """
+    buffer = BytesIO()
+    Image.new('RGB', (120, 90), COVER_COLOR).save(buffer, 'JPEG')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CoverHandler)
+    server.covers = {'/vi/abc/hqdefault.jpg': buffer.getvalue()}
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def test_cover_color_falls_back_to_next_candidate(cover_server):
+    fetcher = ThumbnailFetcher(cache_dir=None, base_url=base_url(cover_server))
+    try:
+        color = fetcher.cover_color('abc')
+    finally:
+        fetcher.close()
+    assert max(abs(a - b) for a, b in zip(color, COVER_COLOR)) <= 3
+    assert sorted(cover_server.requests) == ['/vi/abc/hqdefault.jpg', '/vi/abc/maxresdefault.jpg']
+
+def test_cover_color_is_cached_in_memory_and_on_disk(cover_server, tmp_path):
+    fetcher = ThumbnailFetcher(cache_dir=str(tmp_path), base_url=base_url(cover_server))
+    try:
+        color = fetcher.cover_color('abc')
+        requests = len(cover_server.requests)
+        assert fetcher.cover_color('abc') == color
+        assert len(cover_server.requests) == requests
+    finally:
+        fetcher.close()
+
+    # A new fetcher (e.g. the next run) reads the color from the disk cache
+    fetcher = ThumbnailFetcher(cache_dir=str(tmp_path), base_url=base_url(cover_server))
+    try:
+        assert fetcher.cover_color('abc') == color
+    finally:
+        fetcher.close()
+    assert len(cover_server.requests) == requests
+
+def test_missing_cover_gives_no_color(cover_server):
+    fetcher = ThumbnailFetcher(cache_dir=None, base_url=base_url(cover_server))
+    try:
+        assert fetcher.cover_color('missing') is None
+    finally:
+        fetcher.close()
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import tempfile
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import metrics
+from visualization import get_dominant_color
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "audiovisualizer", "thumbnails")
+DEFAULT_BASE_URL = "https://img.youtube.com"
+# Best first; the first candidate that succeeds wins
+THUMBNAIL_NAMES = ("maxresdefault.jpg", "hqdefault.jpg")
+# (connect, read) seconds; a thumbnail that takes longer is not worth waiting for
+DEFAULT_TIMEOUT = (3.05, 10)
+
+class ThumbnailFetcher:
+    """
+    Fetches album covers (video thumbnails) and their dominant color. All candidate URLs
+    are requested at once over a pooled requests.Session with timeouts, and the best one
+    that succeeds is used. Covers and colors are cached on disk by video id under
+    `cache_dir` (None keeps them in memory only). `base_url` points the fetcher at
+    another host, e.g. a local HTTP stand-in for tests.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, base_url=DEFAULT_BASE_URL, timeout=DEFAULT_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._colors = {}
+        self._session = None
+        self._lock = threading.Lock()
+        # Shared by all fetches; slower candidates left running after a better one wins
+        # finish (or time out) in the background instead of holding up the caller
+        self._executor = ThreadPoolExecutor(max_workers=len(THUMBNAIL_NAMES) * 4)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                # requests is imported on first use, like yt-dlp, to keep startup fast
+                import requests
+                from requests.adapters import HTTPAdapter
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=len(THUMBNAIL_NAMES) * 4)
+                self._session.mount('https://', adapter)
+                self._session.mount('http://', adapter)
+            return self._session
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def candidate_urls(self, video_id):
+        return [f"{self.base_url}/vi/{video_id}/{name}" for name in THUMBNAIL_NAMES]
+
+    def _cache_path(self, video_id, extension):
+        return os.path.join(self.cache_dir, re.sub(r'[^A-Za-z0-9_-]', '_', video_id) + extension)
+
+    def _get(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+        return response.content
+
+    def fetch(self, video_id):
+        """Cover image bytes for a video (cached, else the best candidate), or None"""
+        if self.cache_dir:
+            try:
+                with open(self._cache_path(video_id, '.jpg'), 'rb') as f:
+                    return f.read()
+            except OSError:
+                pass
+
+        urls = self.candidate_urls(video_id)
+        futures = [self._executor.submit(self._get, url) for url in urls]
+        for url, future in zip(urls, futures):
+            try:
+                content = future.result()
+            except Exception as e:
+                print(f"[WARN] Thumbnail fetch failed for {url}: {e}")
+                continue
+            for other in futures:
+                other.cancel()
+            self._write_cache(video_id, '.jpg', content)
+            return content
+        return None
+
+    def cover_color(self, video_id):
+        """Dominant color of a video's cover, or None when no cover could be fetched"""
+        with metrics.stage('thumbnail') as info:
+            if video_id in self._colors:
+                return self._colors[video_id]
+            color = self._read_cached_color(video_id)
+            info['cached'] = color is not None
+            if color is None:
+                content = self.fetch(video_id)
+                if content is None:
+                    print("[WARN] No usable thumbnail found, using fallback background color.")
+                    return None
+                info['bytes'] = len(content)
+                try:
+                    color = get_dominant_color([Image.open(BytesIO(content))])
+                except Exception as e:
+                    print(f"[WARN] Could not read thumbnail for {video_id}: {e}")
+                    return None
+                self._write_cache(video_id, '.json', json.dumps({'color': list(color)}).encode('utf-8'))
+            self._colors[video_id] = color
+            print(f"[INFO] Auto-detected background color from album cover: RGB{color}")
+            return color
+
+    def _read_cached_color(self, video_id):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(video_id, '.json')) as f:
+                return tuple(json.load(f)['color'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_cache(self, video_id, extension, content):
+        """Atomically write one cache file; failures only cost a re-fetch next time"""
+        if not self.cache_dir:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, self._cache_path(video_id, extension))
+        except OSError as e:
+            print(f"[WARN] Could not write thumbnail cache entry: {e}")
+
+def get_default_fetcher():
+    """
+    Fetcher configured from AUDIOVISUALIZER_THUMBNAIL_CACHE_DIR and
+    AUDIOVISUALIZER_THUMBNAIL_URL; AUDIOVISUALIZER_CACHE=0 keeps covers in memory only.
+    """
+    cache_dir = None
+    if os.environ.get("AUDIOVISUALIZER_CACHE", "1") != "0":
+        cache_dir = os.environ.get("AUDIOVISUALIZER_THUMBNAIL_CACHE_DIR", DEFAULT_CACHE_DIR)
+    base_url = os.environ.get("AUDIOVISUALIZER_THUMBNAIL_URL", DEFAULT_BASE_URL)
+    try:
+        return ThumbnailFetcher(cache_dir, base_url)
+    except OSError as e:
+        print(f"[WARN] Thumbnail cache disabled: {e}")
+        return ThumbnailFetcher(None, base_url)
@@ -1,33 +1,32 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patheffects as PathEffects
 from PIL import Image, ImageDraw, ImageFont
 from collections import Counter
-from io import BytesIO
 import os
-from config import sanitize_filename, get_text_color, get_font_path_from_matplotlib
+import metrics
+from config import sanitize_filename, get_text_color, get_font_path_from_matplotlib, load_font
 
 def create_gradient_image(colors, height=100, target_width=1000):
-    """Create a consistent-width gradient image from color list"""
+    """
+    Create a consistent-width gradient image from a color list or (N, 3) array.
+    Lists of another length are resampled to `target_width` by nearest neighbour.
+    """
+    colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
     width = len(colors)
     if width == 0:
         return np.zeros((height, target_width, 3), dtype=np.uint8)
 
-    img = np.zeros((height, target_width, 3), dtype=np.uint8)
+    row = colors if width == target_width else colors[(np.arange(target_width) * width) // target_width]
+    return np.repeat(row[np.newaxis], height, axis=0)
 
-    for i in range(min(width, target_width)):
-        img[:, i, :] = colors[i]
 
-    # If there's a bunch of silence fill remaining with last valid color until it reaches target width (this is to handle a glitch)
-    if width < target_width:
-        img[:, width:, :] = colors[-1]
-
-    return img
-
-
-def get_dominant_color(images):
-    """Compute a perceptually balanced dominant color from the list of images (e.g., album covers)"""
-    all_pixels = []
+def get_dominant_color(images, size=(50, 50), min_brightness=20, max_brightness=740):
+    """
+    Compute a perceptually balanced dominant color from the list of images (e.g., album covers).
+    Each image is downscaled to `size` and pixels whose R+G+B is outside
+    (min_brightness, max_brightness) are ignored so near-black and near-white don't dominate.
+    """
+    channel_sums = np.zeros(3, dtype=np.int64)
+    pixel_count = 0
 
     for img in images:
         if isinstance(img, np.ndarray):
@@ -35,145 +34,158 @@ def get_dominant_color(images):
         else:
             pil_img = img
 
-        pil_img = pil_img.resize((50, 50))
-        pixels = list(pil_img.getdata())
+        pixels = np.asarray(pil_img.resize(size))
+        if pixels.ndim < 3 or pixels.shape[2] < 3:
+            continue  # single-band (grayscale/palette) images carry no color
 
-        filtered = [p[:3] for p in pixels if isinstance(p, tuple) and 20 < sum(p[:3]) < 740]
-        all_pixels.extend(filtered)
+        rgb = pixels[..., :3].reshape(-1, 3).astype(np.int64)
+        brightness = rgb.sum(axis=1)
+        mask = (brightness > min_brightness) & (brightness < max_brightness)
+        channel_sums += rgb[mask].sum(axis=0)
+        pixel_count += int(mask.sum())
 
-    if not all_pixels:
+    if not pixel_count:
         return (0, 0, 0)
 
-    avg = tuple(int(np.mean([p[i] for p in all_pixels])) for i in range(3))
+    avg = tuple(int(total / pixel_count) for total in channel_sums)
     print(f"\nCalculated average RGB color from album art: {avg}")
     return avg
 
+# Track image layout, matching what the previous matplotlib figure produced: a 1000x100 px
+# figure whose axes (and so the tightly cropped output) covered 775x77 px, with an 18pt title
+# (25 px at 100 dpi) and a 3pt outline placed 1% in from the bottom-left corner
+TRACK_WIDTH = 775
+TRACK_HEIGHT = 77
+TRACK_TITLE_SIZE = 25
+TRACK_TITLE_STROKE = 2
+TRACK_TITLE_SHEAR = 0.2  # synthetic italic for fonts without a script/italic look
+
+def track_size(width=TRACK_WIDTH):
+    """(width, height) of a track image `width` px wide, keeping the default aspect ratio"""
+    return width, max(1, round(width * TRACK_HEIGHT / TRACK_WIDTH))
+
 def create_track_visualization(gradient_image, title, output_path):
-    """Create visualization for a single track"""
-    # Fixed output dimensions
-    final_width = 1000
-    final_height = 100
-    dpi = 100
-    fig_w = final_width / dpi
-    fig_h = final_height / dpi
-    
-    # Create the image with matplotlib
-    plt.figure(figsize=(fig_w, fig_h), dpi=dpi)
-    plt.imshow(gradient_image, aspect='auto')
-    plt.axis('off')
-    
+    """Create visualization for a single track and save it to `output_path`"""
+    render_track_image(gradient_image, title).save(output_path)
+    return output_path
+
+def render_track_image(gradient_image, title, width=TRACK_WIDTH):
+    """
+    Render the visualization for a single track as an in-memory RGB image `width` px wide;
+    the height, title and outline scale with it
+    """
+    with metrics.stage('render', width=width):
+        return _render_track_image(gradient_image, title, width)
+
+def _render_track_image(gradient_image, title, width):
+    scale = width / TRACK_WIDTH
+    width, height = track_size(width)
+    title_size = max(1, round(TRACK_TITLE_SIZE * scale))
+    stroke = max(1, round(TRACK_TITLE_STROKE * scale))
+
+    # Scale the gradient to the track image size
+    img = Image.fromarray(np.asarray(gradient_image, dtype=np.uint8))
+    if img.size != (width, height):
+        img = img.resize((width, height), Image.LANCZOS)
+    img = img.convert('RGBA')
+
     # Determine text color based on average brightness of bottom-left area
-    corner_region = gradient_image[-30:, :30, :]  
+    corner_region = gradient_image[-30:, :30, :]
     avg_color = np.mean(corner_region, axis=(0, 1))
     brightness = (0.299 * avg_color[0] + 0.587 * avg_color[1] + 0.114 * avg_color[2]) / 255
-    text_color = 'black' if brightness > 0.5 else 'white'
-    
-    # Create text with improved styling
-    font_size = int(final_height * 0.18)  # Larger text
-    text = plt.text(
-        0.01, 0.01,
-        title,
-        color=text_color,
-        fontsize=font_size,
-        fontname='Forte',
-        fontstyle='italic',  # Italic for style
-        transform=plt.gca().transAxes,
-        va='bottom',
-        ha='left'
-    )
-    
+    text_color = (0, 0, 0) if brightness > 0.5 else (255, 255, 255)
     # Add outline with opposite color for better visibility
-    outline_color = 'white' if text_color == 'black' else 'black'
-    text.set_path_effects([
-        PathEffects.withStroke(linewidth=3, foreground=outline_color)
-    ])
-    
-    # Save to a BytesIO object first
-    buf = BytesIO()
-    plt.savefig(
-        buf,
-        dpi=dpi,
-        bbox_inches='tight',
-        pad_inches=0,
-        format='png'
+    outline_color = (255, 255, 255) if text_color == (0, 0, 0) else (0, 0, 0)
+
+    font_path = get_font_path_from_matplotlib('Forte')
+    if font_path:
+        font = load_font(font_path, title_size)
+    else:
+        font = ImageFont.load_default()
+
+    # Draw the title on its own layer so it can be slanted without touching the gradient
+    baseline_x = round(width * 0.01)
+    bottom_y = height - round(height * 0.01) - stroke
+    text_layer = Image.new('RGBA', img.size, (0, 0, 0, 0))
+    ImageDraw.Draw(text_layer).text(
+        (baseline_x, bottom_y), title, font=font, fill=text_color, anchor='ld',
+        stroke_width=stroke, stroke_fill=outline_color
     )
-    plt.close()
-    
-    # Convert to PIL Image and save
-    buf.seek(0)
-    img = Image.open(buf)
-    img.save(output_path)
-    
-    return output_path
+    # Forte is already a script face (matplotlib drew it upright too); slant anything else
+    if not font_path or 'forte' not in os.path.basename(font_path).lower():
+        shear = TRACK_TITLE_SHEAR
+        text_layer = text_layer.transform(
+            text_layer.size, Image.AFFINE, (1, shear, -shear * bottom_y, 0, 1, 0), resample=Image.BICUBIC
+        )
 
-def stack_images_with_margin(image_files, margin=10, border=30, bg_color=None, album_title=None):
-    """Stack multiple images with margin between them and border around with adaptive title sizing"""
-    if not image_files:
-        return None
-    
-    # Load images
-    images = []
-    for img_file in image_files:
-        if isinstance(img_file, str):
-            img = Image.open(img_file)
+    return Image.alpha_composite(img, text_layer).convert('RGB')
+
+class AlbumCompositor:
+    """
+    Combined album image builder that loads the track images and fits the title font once,
+    so the background color can be changed repeatedly with `recompose` without touching disk.
+    Tracks can be given as file paths, PIL images or arrays.
+    """
+
+    def __init__(self, image_files, album_title=None, margin=10, border=30):
+        self.images = []
+        for img_file in image_files:
+            if isinstance(img_file, str):
+                with Image.open(img_file) as img:
+                    self.images.append(img.convert('RGB'))
+            elif isinstance(img_file, Image.Image):
+                self.images.append(img_file.convert('RGB'))
+            else:
+                self.images.append(Image.fromarray(img_file))
+        self.album_title = album_title
+        self.margin = margin
+        self.border = border
+        self._dominant_color = None
+
+        # Determine dimensions
+        self.width = max(img.width for img in self.images)
+        self.total_height = sum(img.height for img in self.images) + margin * (len(self.images) - 1)
+
+        # Calculate ideal title height based on image dimensions
+        # For wider images, we can use a larger title area
+        # Assume that title height should be proportional to the width but with min/max limits
+        # Limits grow with posters wider than the default track width
+        title_scale = max(1.0, self.width / TRACK_WIDTH)
+        min_title_height = int(60 * title_scale)  # Minimum title space
+        max_title_height = int(150 * title_scale)  # Maximum title space
+
+        # Base the title height on total image dimensions
+        # Use square root of total area as a reference to avoid extreme ratios
+        image_area = self.width * self.total_height
+        sqrt_area = (image_area ** 0.5)
+
+        if album_title:
+            # Longer titles need more space
+            title_length_factor = min(1.5, max(0.8, len(album_title) / 30))
+            self.title_height = int(min(max_title_height,
+                                        max(min_title_height, sqrt_area * 0.1 * title_length_factor)))
         else:
-            img = Image.fromarray(img_file)
-        images.append(img)
-    
-    # If no background color specified, determine from images
-    if bg_color is None:
-        bg_color = get_dominant_color(images)
-        print(f"Using detected background color: RGB{bg_color}")
-    else:
-        print(f"Using user-specified background color: RGB{bg_color}")
-    
-    # Determine text color for best contrast
-    text_color = get_text_color(bg_color)
-    
-    # Determine dimensions
-    width = max(img.width for img in images)
-    total_height = sum(img.height for img in images) + margin * (len(images) - 1)
-    
-    # Calculate ideal title height based on image dimensions
-    # For wider images, we can use a larger title area
-    # Assume that title height should be proportional to the width but with min/max limits
-    min_title_height = 60  # Minimum title space
-    max_title_height = 150  # Maximum title space
-    
-    # Base the title height on total image dimensions
-    # Use square root of total area as a reference to avoid extreme ratios
-    image_area = width * total_height
-    sqrt_area = (image_area ** 0.5)
-    
-    if album_title:
-        # Longer titles need more space
-        title_length_factor = min(1.5, max(0.8, len(album_title) / 30))
-        title_height = int(min(max_title_height, 
-                               max(min_title_height, sqrt_area * 0.1 * title_length_factor)))
-    else:
-        title_height = 0
-    
-    print(f"Using title height: {title_height}px for width: {width}px")
-    
-    # Create new image with margin for border
-    combined = Image.new('RGB', 
-                        (width + 2*border, total_height + 2*border + title_height),
-                        color=bg_color)
-    
-    # Add album title if provided
-    if album_title and title_height > 0:
+            self.title_height = 0
+
+        print(f"Using title height: {self.title_height}px for width: {self.width}px")
+
+        self.size = (self.width + 2 * border, self.total_height + 2 * border + self.title_height)
+        self.title_lines = self._fit_title() if album_title and self.title_height > 0 else []
+
+    def _fit_title(self):
+        """Pick font size(s) and positions for the title: a list of (xy, text, font, outline_size)"""
         try:
-            from PIL import ImageFont, ImageDraw
-            
             # Simplify display title
-            if " [" in album_title:
-                display_title = album_title.split(" [")[0]
-            elif " {" in album_title:
-                display_title = album_title.split(" {")[0]
+            if " [" in self.album_title:
+                display_title = self.album_title.split(" [")[0]
+            elif " {" in self.album_title:
+                display_title = self.album_title.split(" {")[0]
             else:
-                display_title = album_title
+                display_title = self.album_title
 
-            draw = ImageDraw.Draw(combined)
+            draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+            title_height = self.title_height
+            anchor_x = (self.width + 2 * self.border) // 2
 
             # Font loading
             forte_path = get_font_path_from_matplotlib('Forte')
@@ -185,10 +197,10 @@ def stack_images_with_margin(image_files, margin=10, border=30, bg_color=None, a
 
             # Try to fit title in one line
             for font_size in range(max_font_size, min_font_size - 1, -2):
-                font = ImageFont.truetype(font_path, font_size)
+                font = load_font(font_path, font_size)
                 bbox = draw.textbbox((0, 0), display_title, font=font)
                 text_width = bbox[2] - bbox[0]
-                if text_width <= width:
+                if text_width <= self.width:
                     break
             else:
                 # If no font size fits, break into two lines
@@ -196,54 +208,79 @@ def stack_images_with_margin(image_files, margin=10, border=30, bg_color=None, a
                 midpoint = len(words) // 2
                 line1 = ' '.join(words[:midpoint])
                 line2 = ' '.join(words[midpoint:])
-                line1_font = ImageFont.truetype(font_path, max(min_font_size, int(title_height * 0.35)))
-                line2_font = ImageFont.truetype(font_path, max(min_font_size, int(title_height * 0.35)))
+                line_font = load_font(font_path, max(min_font_size, int(title_height * 0.35)))
+                print(f"Added title in two lines: '{line1}' / '{line2}'")
+                return [
+                    ((anchor_x, int(title_height * 0.3)), line1, line_font, 1),
+                    ((anchor_x, int(title_height * 0.7)), line2, line_font, 1),
+                ]
 
-                text_color = get_text_color(bg_color)
-                outline_color = (0, 0, 0) if text_color == (255, 255, 255) else (255, 255, 255)
-                anchor_x = (width + 2 * border) // 2
-                y1 = int(title_height * 0.3)
-                y2 = int(title_height * 0.7)
+            # If it fit in one line
+            print(f"Added title: '{display_title}' with font size {font_size}")
+            outline_size = max(2, int(font_size * 0.05))
+            return [((anchor_x, title_height // 2), display_title, font, outline_size)]
+
+        except Exception as e:
+            print(f"Title rendering error: {e}")
+            return []
 
-                for dx, dy in [(-1, -1), (1, -1), (-1, 1), (1, 1)]:
-                    draw.text((anchor_x + dx, y1 + dy), line1, font=line1_font, fill=outline_color, anchor="mm")
-                    draw.text((anchor_x + dx, y2 + dy), line2, font=line2_font, fill=outline_color, anchor="mm")
+    def dominant_color(self):
+        """Background color detected from the track images (computed once)"""
+        if self._dominant_color is None:
+            self._dominant_color = get_dominant_color(self.images)
+        return self._dominant_color
 
-                draw.text((anchor_x, y1), line1, font=line1_font, fill=text_color, anchor="mm")
-                draw.text((anchor_x, y2), line2, font=line2_font, fill=text_color, anchor="mm")
-                print(f"Added title in two lines: '{line1}' / '{line2}'")
-                return combined  # Skip single-line drawing below
+    def recompose(self, bg_color=None):
+        """Paint the background and title in `bg_color` and paste the tracks; returns an in-memory image"""
+        if bg_color is None:
+            bg_color = self.dominant_color()
+        bg_color = tuple(bg_color)
 
-            # If it fit in one line
-            font = ImageFont.truetype(font_path, font_size)
+        combined = Image.new('RGB', self.size, color=bg_color)
+
+        # Add album title, outlined in the opposite color for contrast
+        if self.title_lines:
+            draw = ImageDraw.Draw(combined)
             text_color = get_text_color(bg_color)
             outline_color = (0, 0, 0) if text_color == (255, 255, 255) else (255, 255, 255)
-            outline_size = max(2, int(font_size * 0.05))
-            x = (width + 2 * border) // 2
-            y = title_height // 2
+            for (x, y), text, font, outline_size in self.title_lines:
+                for dx, dy in [(-outline_size, -outline_size), (outline_size, -outline_size),
+                               (-outline_size, outline_size), (outline_size, outline_size)]:
+                    draw.text((x + dx, y + dy), text, fill=outline_color, font=font, anchor="mm")
+                draw.text((x, y), text, fill=text_color, font=font, anchor="mm")
 
-            for dx, dy in [(-outline_size, -outline_size), (outline_size, -outline_size),
-                        (-outline_size, outline_size), (outline_size, outline_size)]:
-                draw.text((x + dx, y + dy), display_title, fill=outline_color, font=font, anchor="mm")
-            draw.text((x, y), display_title, fill=text_color, font=font, anchor="mm")
-            print(f"Added title: '{display_title}' with font size {font_size}")
+        # Paste images with margins
+        y_offset = self.border + self.title_height
+        for img in self.images:
+            # Center horizontally if narrower than max width
+            x_offset = self.border + (self.width - img.width) // 2
+            combined.paste(img, (x_offset, y_offset))
+            y_offset += img.height + self.margin
 
-        except Exception as e:
-            print(f"Title rendering error: {e}")
+        return combined
 
-    
-    # Paste images with margins
-    y_offset = border + title_height
-    for img in images:
-        # Center horizontally if narrower than max width
-        x_offset = border + (width - img.width) // 2
-        combined.paste(img, (x_offset, y_offset))
-        y_offset += img.height + margin
-    
-    return combined
+def stack_images_with_margin(image_files, margin=10, border=30, bg_color=None, album_title=None):
+    """Stack multiple images with margin between them and border around with adaptive title sizing"""
+    if not image_files:
+        return None
+
+    with metrics.stage('composite', tracks=len(image_files)):
+        return _stack_images(image_files, margin, border, bg_color, album_title)
+
+def _stack_images(image_files, margin, border, bg_color, album_title):
+    compositor = AlbumCompositor(image_files, album_title, margin=margin, border=border)
+
+    # If no background color specified, determine from images
+    if bg_color is None:
+        bg_color = compositor.dominant_color()
+        print(f"Using detected background color: RGB{bg_color}")
+    else:
+        print(f"Using user-specified background color: RGB{bg_color}")
+
+    return compositor.recompose(bg_color)
 
 def create_combined_image(image_paths, output_folder, album_title, bg_color=None):
-    """Create and save a combined image from all track visualizations"""
+    """Create and save a combined image from all track visualizations (paths or in-memory images)"""
     combined = stack_images_with_margin(
         image_paths, 
         margin=5, 
@@ -253,8 +290,16 @@ def create_combined_image(image_paths, output_folder, album_title, bg_color=None
     )
     
     # Save combined image
-    combined_path = os.path.join(output_folder, f"{sanitize_filename(album_title)}_combined.png")
+    combined_path = combined_image_path(output_folder, album_title)
     combined.save(combined_path)
     print(f"Saved combined image: {combined_path}")
     
-    return combined_path
\ No newline at end of file
+    return combined_path
+
+def combined_image_path(output_folder, album_title, width=None, mode=None):
+    """
+    Where create_combined_image saves the combined image for an album; extra versions
+    in another color `mode` or at another `width` get a `_<mode>` / `_<width>px` suffix
+    """
+    suffix = (f"_{mode}" if mode else "") + (f"_{width}px" if width else "")
+    return os.path.join(output_folder, f"{sanitize_filename(album_title)}_combined{suffix}.png")
@@ -1,28 +1,122 @@
 import os
 import re
 import subprocess
-from yt_dlp import YoutubeDL
+import shutil
+import threading
+from contextlib import nullcontext
+from urllib.parse import urlparse, parse_qs
+import audio_processing
+import metrics
 
-def download_youtube_audio_and_metadata(url, output_filename='audio.wav'):
+LOCAL_AUDIO_EXTENSIONS = ('.wav', '.flac', '.mp3', '.m4a', '.ogg', '.opus', '.webm')
+
+class LocalYoutubeDL:
+    """
+    Offline stand-in for YoutubeDL that serves audio files from a directory.
+    Each file is a video whose id and title are its file name without extension;
+    any search or playlist URL resolves to a playlist of every file in the directory.
+    Used in place of YoutubeDL when a `media_dir` is passed to the functions below.
+    """
+
+    def __init__(self, params, media_dir):
+        self.params = params
+        self.media_dir = media_dir
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _files(self):
+        return sorted(f for f in os.listdir(self.media_dir) if f.lower().endswith(LOCAL_AUDIO_EXTENSIONS))
+
+    def _video_info(self, filename):
+        video_id, ext = os.path.splitext(filename)
+        return {
+            'id': video_id,
+            'title': video_id,
+            'uploader': 'Local',
+            'ext': ext.lstrip('.'),
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+        }
+
+    def extract_info(self, url, download=False):
+        name = os.path.basename(os.path.normpath(self.media_dir))
+        if url.startswith('ytsearch'):
+            return {'entries': [{'_type': 'playlist', 'id': name, 'title': name}]}
+
+        video_id = parse_qs(urlparse(url).query).get('v', [None])[0]
+        if video_id is None:
+            entries = [self._video_info(f) for f in self._files()]
+            return {'_type': 'playlist', 'id': name, 'title': name, 'entries': entries}
+
+        filename = next(f for f in self._files() if os.path.splitext(f)[0] == video_id)
+        info = self._video_info(filename)
+        if download:
+            shutil.copy(os.path.join(self.media_dir, filename), self.prepare_filename(info))
+        return info
+
+    def prepare_filename(self, info):
+        return self.params.get('outtmpl', '%(title)s.%(ext)s') % info
+
+# Metadata and search instances, reused per thread across calls (and across jobs in a batch)
+_shared = threading.local()
+
+def _youtube_dl(options, reuse=False, media_dir=None):
+    """
+    YoutubeDL, or the LocalYoutubeDL stand-in serving `media_dir` when one is given. With
+    `reuse=True` the calling thread gets the same instance for the same options every time;
+    it is not closed on exit, which keeps its extractors and HTTP connections warm.
+    """
+    # yt-dlp is imported on first use; it is the slowest import in the app and local jobs never need it
+    from yt_dlp import YoutubeDL
+    if not reuse:
+        return LocalYoutubeDL(options, media_dir) if media_dir else YoutubeDL(options)
+
+    instances = getattr(_shared, 'instances', None)
+    if instances is None:
+        instances = _shared.instances = {}
+    key = (media_dir, tuple(sorted(options.items())))
+    if key not in instances:
+        instances[key] = LocalYoutubeDL(options, media_dir) if media_dir else YoutubeDL(options)
+    return nullcontext(instances[key])
+
+def download_youtube_audio_and_metadata(url, output_filename='audio.wav', transcode=True, media_dir=None):
+    """
+    Download the best audio stream for `url`. With `transcode=True` it is converted to a
+    pcm_s16le WAV at `output_filename`; otherwise the downloaded file is kept as-is next to
+    `output_filename` (same name, original extension) for decoding over an ffmpeg pipe.
+    """
+    # The transcode source sits next to the output rather than in the working directory,
+    # so concurrent jobs never share a temp file
+    base = os.path.splitext(output_filename)[0] + ('_source' if transcode else '')
+    outtmpl = base.replace('%', '%%') + '.%(ext)s'
     options = {
         'format': 'bestaudio/best',
-        'outtmpl': 'temp_audio.%(ext)s',
+        'outtmpl': outtmpl,
         'quiet': True,
     }
-    with YoutubeDL(options) as ydl:
+    with metrics.stage('download') as stage_info, _youtube_dl(options, media_dir=media_dir) as ydl:
         info = ydl.extract_info(url, download=True)
+        downloaded_filename = ydl.prepare_filename(info)
+        if os.path.exists(downloaded_filename):
+            stage_info['bytes'] = os.path.getsize(downloaded_filename)
     title = info.get('title', 'Unknown Title')
     artist = info.get('uploader', 'Unknown Artist')
-    temp_filename = f"temp_audio.{info['ext']}"
+    if not transcode:
+        return downloaded_filename, title, artist
+
+    temp_filename = downloaded_filename
 
     try:
-        subprocess.run([
-            'ffmpeg', '-i', temp_filename, '-acodec', 'pcm_s16le', '-y', output_filename
-        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with metrics.stage('transcode', bytes=os.path.getsize(temp_filename)):
+            subprocess.run([
+                'ffmpeg', '-i', temp_filename, '-acodec', 'pcm_s16le', '-y', output_filename
+            ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         print(f"Converted {temp_filename} to {output_filename} using FFmpeg")
     except Exception as e:
         print(f"Error converting audio with FFmpeg: {e}")
-        import shutil
         shutil.copy(temp_filename, output_filename)
         print(f"Copied original file instead")
 
@@ -33,9 +127,9 @@ def download_youtube_audio_and_metadata(url, output_filename='audio.wav'):
 
     return output_filename, title, artist
 
-def search_youtube_playlist(query, selection_index=None, return_entries_only=False):
+def search_youtube_playlist(query, selection_index=None, return_entries_only=False, media_dir=None):
     if query.startswith("http") and ("list=" in query or "playlist" in query):
-        return load_youtube_url(query)
+        return load_youtube_url(query, media_dir)
 
     search_query = f"{query}"
     options = {
@@ -46,9 +140,10 @@ def search_youtube_playlist(query, selection_index=None, return_entries_only=Fal
         'max_results': 8,
     }
 
-    with YoutubeDL(options) as ydl_flat:
+    with _youtube_dl(options, reuse=True, media_dir=media_dir) as ydl_flat:
         try:
-            results = ydl_flat.extract_info(f"ytsearch8:{search_query}", download=False)
+            with metrics.stage('search'):
+                results = ydl_flat.extract_info(f"ytsearch8:{search_query}", download=False)
             entries = results.get('entries', [])
             if not entries:
                 return None
@@ -56,11 +151,6 @@ def search_youtube_playlist(query, selection_index=None, return_entries_only=Fal
             if return_entries_only:
                 return entries
 
-            if selection_index is None:
-                env_index = os.environ.get("AUDIOVISUALIZER_SELECTION_INDEX")
-                if env_index is not None and env_index.isdigit():
-                    selection_index = int(env_index)
-
             selected = entries[selection_index] if selection_index is not None else entries[0]
 
             eid = selected.get('id')
@@ -73,12 +163,13 @@ def search_youtube_playlist(query, selection_index=None, return_entries_only=Fal
             print(f"Search error: {e}")
             return None
 
-    return load_youtube_url(real_url)
+    return load_youtube_url(real_url, media_dir)
 
-def load_youtube_url(link):
+def load_youtube_url(link, media_dir=None):
     try:
-        with YoutubeDL({'quiet': True, 'skip_download': True}) as ydl:
-            info = ydl.extract_info(link, download=False)
+        with _youtube_dl({'quiet': True, 'skip_download': True}, reuse=True, media_dir=media_dir) as ydl:
+            with metrics.stage('metadata'):
+                info = ydl.extract_info(link, download=False)
 
             if 'entries' in info and len(info['entries']) > 1:
                 print(f"✅ Loaded playlist: {info.get('title')} ({len(info['entries'])} tracks)")
@@ -96,8 +187,12 @@ def load_youtube_url(link):
         print(f"Error loading YouTube URL: {e}")
         return None
 
-def split_album_video(video_info, output_folder):
-    with YoutubeDL({'quiet': True}) as ydl:
+def split_album_video(video_info, output_folder, sample_rate=44100, media_dir=None):
+    """
+    Split a chaptered video into tracks. The album is downloaded and decoded once and
+    each chapter is returned as a slice of the sample array rather than a separate file.
+    """
+    with metrics.stage('metadata'), _youtube_dl({'quiet': True}, reuse=True, media_dir=media_dir) as ydl:
         full_info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_info['id']}", download=False)
 
     tracks = []
@@ -107,22 +202,16 @@ def split_album_video(video_info, output_folder):
 
         audio_file, _, _ = download_youtube_audio_and_metadata(
             f"https://www.youtube.com/watch?v={video_info['id']}",
-            output_filename=os.path.join(output_folder, 'full_album.wav')
+            output_filename=os.path.join(output_folder, 'full_album.wav'),
+            transcode=False,
+            media_dir=media_dir
         )
 
-        try:
-            result = subprocess.run(
-                ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-                 '-of', 'default=noprint_wrappers=1:nokey=1', audio_file],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            full_duration = float(result.stdout.strip())
-            print(f"Full audio duration: {full_duration:.2f} seconds")
-        except Exception as e:
-            print(f"Error getting audio duration: {e}")
-            full_duration = full_info['chapters'][-1]['end_time'] + 1
+        # Decode the whole album once; each chapter is a zero-copy slice of it
+        samples = audio_processing.decode_audio(audio_file, sample_rate)
+        os.remove(audio_file)
+        full_duration = len(samples) / sample_rate
+        print(f"Full audio duration: {full_duration:.2f} seconds")
 
         for idx, chapter in enumerate(full_info['chapters'], start=1):
             try:
@@ -136,21 +225,16 @@ def split_album_video(video_info, output_folder):
 
                 print(f"  Extracting track {idx}: {chapter_title} ({start_time:.1f}s to {end_time:.1f}s)")
 
-                chapter_filename = os.path.join(output_folder, f"track_{idx:02d}.wav")
-                subprocess.run([
-                    'ffmpeg', '-i', audio_file,
-                    '-ss', str(start_time), '-to', str(end_time),
-                    '-acodec', 'pcm_s16le', '-y', chapter_filename
-                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-                if os.path.exists(chapter_filename):
+                chapter_samples = samples[int(start_time * sample_rate):int(end_time * sample_rate)]
+                if len(chapter_samples) > 0:
                     tracks.append({
                         'id': f"{video_info['id']}_track{idx}",
                         'title': chapter_title,
-                        'file': chapter_filename
+                        'samples': chapter_samples,
+                        'sample_rate': sample_rate
                     })
                 else:
-                    print(f"  Error: Failed to create track file {chapter_filename}")
+                    print(f"  Error: Chapter {idx} is outside the decoded audio")
             except Exception as e:
                 print(f"  Error extracting track {idx}: {e}")
 